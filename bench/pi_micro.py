@@ -0,0 +1,140 @@
+"""
+Pi-side microbenchmarks, run by run.py in the Pi's Python environment under
+the offscreen Qt platform. Prints one JSON object on stdout.
+"""
+
+import json
+import os
+import random
+import statistics
+import sys
+import time
+from io import BytesIO
+
+GUI_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "pi4", "gui")
+sys.path.insert(0, GUI_DIR)
+
+from PIL import Image
+from PySide6.QtWidgets import QApplication
+import comm
+from icon_cache import decode_icon
+from widgets.main_grid import MainGridWidget
+from widgets.scalable_button import FONT_FIT_CACHE, ScalableButton
+
+COMMANDS = [
+    "ui button 0 0 1 1 'Hello world!' broadcast hello",
+    "ui button 1 0 2 1 'Two\\nlines' dispatch nop",
+    "ui bgcolor 0 0 #FF0000",
+    "ui textcolor 1 0 #FFFFFF",
+    "ui icon 2 1 sha256:" + "ab" * 32,
+    "ui reset 3 1",
+    "ui batch begin",
+    "ui batch commit",
+]
+
+
+def bench_parse(count: int) -> dict:
+    """Tokenizing and parsing, the per-command work of Serial.tick()."""
+    lines = [COMMANDS[i % len(COMMANDS)] for i in range(count)]
+    start = time.perf_counter()
+    for line in lines:
+        args = comm.shplit(line)
+        comm.find_parser(args)(args)
+    elapsed = time.perf_counter() - start
+    return {"commands": count, "seconds": elapsed, "commands_per_s": count / elapsed}
+
+
+def bench_grid(app: QApplication, sizes: list[tuple[int, int]], rounds: int) -> dict:
+    """From "ui clean" to every button of an NxM grid painted."""
+    grid = MainGridWidget(1, 1)
+    grid.resize(1024, 600)
+    grid.show()
+    app.processEvents()
+
+    results = {}
+    for width, height in sizes:
+        times = []
+        for _ in range(rounds):
+            # Start from a different size so every round really resizes.
+            grid.resizeGrid(1, 1)
+            app.processEvents()
+            start = time.perf_counter()
+            with grid.batch():
+                grid.resizeGrid(width, height)
+                for x in range(width):
+                    for y in range(height):
+                        grid.set_button(x, y, f"Button {x},{y}")
+            app.processEvents()
+            grid.repaint()
+            times.append(time.perf_counter() - start)
+        results[f"{width}x{height}"] = _summary(times)
+    grid.close()
+    return results
+
+
+def bench_button_fit(app: QApplication, resizes: int) -> dict:
+    """Font fitting per ScalableButton resize, without and with the fit cache."""
+    button = ScalableButton("Some button\ntext")
+    button.show()
+    sizes = [(60 + i % 90, 40 + (i * 7) % 70) for i in range(resizes)]
+
+    def run() -> list[float]:
+        times = []
+        for width, height in sizes:
+            start = time.perf_counter()
+            button.resize(width, height)
+            app.processEvents()
+            times.append(time.perf_counter() - start)
+        return times
+
+    FONT_FIT_CACHE.clear()
+    cold = run()
+    warm = run()
+    button.close()
+    return {"cold": _summary(cold), "warm": _summary(warm)}
+
+
+def bench_icon_decode(count: int, size: int) -> dict:
+    rng = random.Random(0)
+    image = Image.frombytes("RGB", (size, size), bytes(rng.getrandbits(8) for _ in range(size * size * 3)))
+    buffer = BytesIO()
+    image.save(buffer, format="PNG")
+    data = buffer.getvalue()
+
+    start = time.perf_counter()
+    for _ in range(count):
+        decode_icon(data)
+    elapsed = time.perf_counter() - start
+    return {
+        "icons": count,
+        "size": f"{size}x{size}",
+        "png_bytes": len(data),
+        "seconds": elapsed,
+        "icons_per_s": count / elapsed,
+    }
+
+
+def _summary(times: list[float]) -> dict:
+    ms = sorted(t * 1000 for t in times)
+    return {
+        "n": len(ms),
+        "median_ms": statistics.median(ms),
+        "p90_ms": ms[min(len(ms) - 1, int(len(ms) * 0.9))],
+        "max_ms": ms[-1],
+    }
+
+
+def main():
+    quick = "--quick" in sys.argv
+    app = QApplication(sys.argv[:1])
+    results = {
+        "parse": bench_parse(2000 if quick else 20000),
+        "grid_render": bench_grid(app, [(4, 2), (8, 5), (16, 10)], 2 if quick else 5),
+        "button_fit": bench_button_fit(app, 50 if quick else 300),
+        "icon_decode": bench_icon_decode(20 if quick else 200, 128),
+    }
+    json.dump(results, sys.stdout)
+
+
+if __name__ == "__main__":
+    main()
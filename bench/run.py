@@ -0,0 +1,212 @@
+"""
+Headless benchmarks for pideck.
+
+Creates a pty pair standing in for the serial link, runs the Pi app on one end
+under the offscreen Qt platform and drives it from the host library on the
+other. Pi internals are measured separately by pi_micro.py. Everything is
+written to one JSON file for regression tracking.
+
+    python bench/run.py --out bench-results.json [--quick]
+
+The host modules are imported here and the Pi's run in subprocesses, since
+both sides have a module called `comm`. Use --pi-python if the Pi's
+dependencies live in a different environment.
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import platform
+import select
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import tty
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+ROOT = os.path.dirname(BENCH_DIR)
+GUI_DIR = os.path.join(ROOT, "pi4", "gui")
+sys.path.insert(0, os.path.join(ROOT, "host"))
+
+from actions import Dispatcher, action
+from client import Client
+from deck import Deck
+
+
+def open_pty_pair() -> tuple[str, str]:
+    """
+    Two ptys whose master sides are relayed to each other by a daemon thread,
+    the same wiring pi4/socat.sh sets up. Returns the two device paths.
+    """
+    ends = []
+    for _ in range(2):
+        master, slave = os.openpty()
+        tty.setraw(slave)
+        ends.append((master, slave))
+    (master_a, slave_a), (master_b, slave_b) = ends
+
+    def relay():
+        while True:
+            readable, _, _ = select.select([master_a, master_b], [], [])
+            for fd in readable:
+                data = os.read(fd, 65536)
+                os.write(master_b if fd == master_a else master_a, data)
+
+    threading.Thread(target=relay, daemon=True, name="pty-relay").start()
+    return os.ttyname(slave_a), os.ttyname(slave_b)
+
+
+def pi_env(port: str, cache_dir: str) -> dict:
+    env = dict(os.environ)
+    env.update(PIDECK_PORT=port, QT_QPA_PLATFORM="offscreen", XDG_CACHE_HOME=cache_dir)
+    return env
+
+
+toggled = False
+
+
+@action("bench")
+def bench_toggle(ui, event):
+    global toggled
+    toggled = not toggled
+    ui.send("ui bgcolor 0 0 " + ("#00FF00" if toggled else "#FF0000"))
+
+
+async def bench_link(client: Client, quick: bool) -> dict:
+    results = {}
+
+    # Sustained command rate over the link: sent, parsed, applied and acked.
+    deck = Deck(client)
+    deck.clean(4, 2)
+    deck.button(0, 0, "Bench", broadcast="bench")
+    await deck.sync()
+    count = 500 if quick else 5000
+    colors = ["#FF0000", "#00FF00"]
+    start = time.perf_counter()
+    await asyncio.gather(
+        *(client.send(f"ui bgcolor 1 0 {colors[i % 2]}") for i in range(count))
+    )
+    elapsed = time.perf_counter() - start
+    results["command_throughput"] = {
+        "commands": count,
+        "seconds": elapsed,
+        "commands_per_s": count / elapsed,
+        "binary": client.serial.binary,
+        "compress": client.serial.compress,
+        "baudrate": client.serial.ser.baudrate,
+    }
+
+    # "ui clean" to a full NxM page, as the host sees it (until every ack).
+    grids = {}
+    for width, height in [(4, 2), (8, 5), (16, 10)]:
+        deck.clean(width, height)
+        for x in range(width):
+            for y in range(height):
+                deck.button(x, y, f"Button {x},{y}")
+        start = time.perf_counter()
+        sent = await deck.sync()
+        grids[f"{width}x{height}"] = {
+            "commands": sent,
+            "seconds": time.perf_counter() - start,
+        }
+    results["grid_sync"] = grids
+
+    # Press round trips through the real press path, timed by the Pi's own
+    # instrumentation (see stats.py).
+    deck.clean(4, 2)
+    deck.button(0, 0, "Bench", broadcast="bench")
+    await deck.sync()
+    dispatcher = Dispatcher(client)
+    dispatching = asyncio.create_task(dispatcher.run())
+    await client.stats(reset=True)
+    presses = 20 if quick else 200
+    for _ in range(presses):
+        await client.send("debug press 0 0")
+        await asyncio.sleep(0.02)
+    await asyncio.sleep(0.5)
+    stats = await client.stats(reset=True)
+    results["press"] = {
+        name: histogram
+        for name, histogram in stats["pi"].items()
+        if name.startswith("press")
+    }
+    results["press"]["host action"] = stats["host"].get("action bench")
+    results["pi_timings"] = {
+        name: histogram
+        for name, histogram in stats["pi"].items()
+        if name.startswith(("parse ", "apply "))
+    }
+
+    results["heartbeat"] = client.link
+
+    dispatcher.close()
+    dispatching.cancel()
+    return results
+
+
+async def run_link(args, cache_dir: str) -> dict:
+    host_port, pi_port = open_pty_pair()
+    started = time.perf_counter()
+    pi = subprocess.Popen(
+        [args.pi_python, "app.py"],
+        cwd=GUI_DIR,
+        env=pi_env(pi_port, cache_dir),
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.DEVNULL,
+    )
+    try:
+        client = Client(host_port, state_path=os.path.join(cache_dir, "host-layout.json"))
+        await client.connect(timeout=30)
+        results = {"handshake_s": time.perf_counter() - started}
+        try:
+            results.update(await bench_link(client, args.quick))
+        finally:
+            client.close()
+        return results
+    finally:
+        pi.terminate()
+        pi.wait(timeout=10)
+
+
+def run_micro(args, cache_dir: str) -> dict:
+    command = [args.pi_python, os.path.join(BENCH_DIR, "pi_micro.py")]
+    if args.quick:
+        command.append("--quick")
+    output = subprocess.run(
+        command,
+        cwd=GUI_DIR,
+        env=pi_env("", cache_dir),
+        check=True,
+        capture_output=True,
+        text=True,
+    )
+    return json.loads(output.stdout)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--out", default="bench-results.json")
+    parser.add_argument("--quick", action="store_true", help="fewer iterations")
+    parser.add_argument("--pi-python", default=sys.executable)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory(prefix="pideck-bench-") as cache_dir:
+        results = {
+            "timestamp": time.time(),
+            "python": platform.python_version(),
+            "machine": platform.machine(),
+            "quick": args.quick,
+            "pi": run_micro(args, cache_dir),
+            "link": asyncio.run(run_link(args, cache_dir)),
+        }
+
+    with open(args.out, "w") as file:
+        json.dump(results, file, indent=2)
+    print(f"Wrote {args.out}")
+
+
+if __name__ == "__main__":
+    main()
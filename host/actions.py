@@ -0,0 +1,205 @@
+import asyncio
+import inspect
+from concurrent.futures import Executor, Future, ProcessPoolExecutor, ThreadPoolExecutor
+from dataclasses import dataclass, field
+from typing import Callable
+import time
+from client import Client, Event
+from stats import STATS
+
+
+@dataclass
+class Action:
+    """A registered broadcast handler; see @action."""
+
+    func: Callable
+    concurrency: int = 1
+    timeout: float | None = None
+    process: bool = False
+    _slots: asyncio.Semaphore | None = field(default=None, repr=False)
+
+
+# Maps a broadcast message (the argument of "broadcast recieve") to the action
+# that handles it. Populated with the @action decorator.
+ACTIONS: dict[str, Action] = {}
+
+
+def action(
+    *messages: str,
+    concurrency: int = 1,
+    timeout: float | None = None,
+    process: bool = False,
+):
+    """
+    Registers the decorated function as the handler for each of `messages`.
+
+    Plain functions are called as func(ui, event) on a worker thread, or in a
+    worker process with process=True (the function must then be importable
+    at module level). Coroutine functions are awaited on the event loop and
+    get the Client itself as `ui`.
+
+    At most `concurrency` runs of the same action happen at once; further
+    presses wait their turn. A run that takes longer than `timeout` seconds
+    is reported as failed and any UI updates it sends afterwards are dropped.
+    """
+
+    def decorator(func: Callable):
+        # One Action for all of them, so they share the concurrency limit.
+        registered = Action(func, concurrency, timeout, process)
+        for message in messages:
+            ACTIONS[message] = registered
+        return func
+
+    return decorator
+
+
+class ThreadUI:
+    """
+    Passed to handlers running on a worker thread. send() hands the command
+    to the event loop and returns a concurrent.futures.Future for its ack.
+    """
+
+    def __init__(self, client: Client, loop: asyncio.AbstractEventLoop):
+        self._client = client
+        self._loop = loop
+        self.expired = False
+
+    def send(self, command: str) -> Future:
+        if self.expired:
+            future = Future()
+            future.set_exception(TimeoutError("action timed out"))
+            return future
+        return asyncio.run_coroutine_threadsafe(self._send(command), self._loop)
+
+    async def _send(self, command: str):
+        await self._client.send(command)
+
+
+class ProcessUI:
+    """
+    Passed to handlers running in a worker process. Commands are collected
+    and sent by the host once the handler returns.
+    """
+
+    def __init__(self):
+        self.commands: list[str] = []
+
+    def send(self, command: str):
+        self.commands.append(command)
+
+
+def _run_in_process(func: Callable, event: Event) -> list[str]:
+    ui = ProcessUI()
+    func(ui, event)
+    return ui.commands
+
+
+class Dispatcher:
+    """Runs registered actions for the broadcasts coming out of a Client."""
+
+    def __init__(
+        self,
+        client: Client,
+        threads: int = 8,
+        processes: int | None = None,
+        actions: dict[str, Action] = ACTIONS,
+    ):
+        self.client = client
+        self.actions = actions
+        self.threads = ThreadPoolExecutor(max_workers=threads, thread_name_prefix="action")
+        self.processes = processes
+        self._process_pool: Executor | None = None
+        self._tasks: set[asyncio.Task] = set()
+
+    def dispatch(self, event: Event) -> bool:
+        """Starts the action for `event`. Returns False if there is none."""
+        if event.name != "broadcast recieve" or not event.args:
+            return False
+        action = self.actions.get(event.args[0])
+        if action is None:
+            return False
+        task = asyncio.create_task(self._run(event.args[0], action, event))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+        return True
+
+    async def run(self):
+        """Dispatches events until the client is closed."""
+        async for event in self.client.events():
+            if not self.dispatch(event):
+                print(event.line)
+
+    def close(self):
+        """Cancels pending runs and shuts the pools down without waiting."""
+        for task in self._tasks:
+            task.cancel()
+        self.threads.shutdown(wait=False, cancel_futures=True)
+        if self._process_pool is not None:
+            self._process_pool.shutdown(wait=False, cancel_futures=True)
+
+    async def _run(self, message: str, action: Action, event: Event):
+        if action._slots is None:
+            action._slots = asyncio.Semaphore(action.concurrency)
+        async with action._slots:
+            try:
+                await self._call(message, action, event)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                print(f"[WARN] Action {message!r} failed: {e!r}")
+
+        handled = time.monotonic() - event.received
+        STATS.record(f"action {message}", handled)
+        press = event.option("press")
+        if press is not None:
+            # Follows the action's own commands, so the Pi can time the rest.
+            try:
+                await self.client.send(f"press done {press} {handled:.6f}")
+            except Exception as e:
+                print(f"[WARN] Could not report press {press}: {e!r}")
+
+    async def _call(self, message: str, action: Action, event: Event):
+        loop = asyncio.get_running_loop()
+
+        if inspect.iscoroutinefunction(action.func):
+            await asyncio.wait_for(action.func(self.client, event), action.timeout)
+            return
+
+        if action.process:
+            if self._process_pool is None:
+                self._process_pool = ProcessPoolExecutor(max_workers=self.processes)
+            future = loop.run_in_executor(
+                self._process_pool, _run_in_process, action.func, event
+            )
+            commands = await self._wait(message, action, future)
+            if commands:
+                await asyncio.gather(*(self.client.send(command) for command in commands))
+            return
+
+        ui = ThreadUI(self.client, loop)
+        future = loop.run_in_executor(self.threads, action.func, ui, event)
+        await self._wait(message, action, future, ui)
+
+    async def _wait(
+        self,
+        message: str,
+        action: Action,
+        future: asyncio.Future,
+        ui: ThreadUI | None = None,
+    ):
+        """
+        Waits up to the action's timeout for a pool job. Workers can't be
+        stopped, so after a timeout the job's UI updates are dropped and its
+        concurrency slot stays taken until it actually returns.
+        """
+        try:
+            return await asyncio.wait_for(asyncio.shield(future), action.timeout)
+        except asyncio.TimeoutError:
+            print(f"[WARN] Action {message!r} timed out after {action.timeout}s")
+            if ui is not None:
+                ui.expired = True
+            try:
+                await future
+            except Exception:
+                pass
+            return None
@@ -0,0 +1,439 @@
+import asyncio
+import hashlib
+import json
+import os
+import shlex
+import time
+from typing import NamedTuple
+import comm
+from heartbeat import HEARTBEAT_INTERVAL, HEARTBEAT_TIMEOUT, Heartbeat
+from stats import STATS
+from layout import DEFAULT_PAGE, Layout, load_pages, pages_hash, save_pages
+
+DEFAULT_STATE_PATH = os.path.join(
+    os.environ.get("XDG_CACHE_HOME", os.path.expanduser("~/.cache")), "pideck", "layout.json"
+)
+
+
+class CommandError(Exception):
+    """A command was rejected by the Pi, or never acknowledged at all."""
+
+    def __init__(self, command: str, reason: str):
+        super().__init__(f"{command!r}: {reason}")
+        self.command = command
+        self.reason = reason
+
+
+class Event(NamedTuple):
+    """
+    A line from the Pi that isn't a reply to a command. `name` is its first
+    two words, the same way the Pi names its commands ("broadcast recieve"),
+    and `args` is everything after that.
+    """
+
+    name: str
+    args: list[str]
+    line: str
+    # time.monotonic() when the line was read.
+    received: float = 0.0
+
+    @classmethod
+    def parse(cls, line: str) -> "Event":
+        try:
+            words = shlex.split(line)
+        except ValueError:
+            words = line.split()
+        return cls(" ".join(words[:2]), words[2:], line, time.monotonic())
+
+    def option(self, key: str) -> str | None:
+        """Value of a trailing "key=value" argument, e.g. a broadcast's press id."""
+        for arg in self.args:
+            if arg.startswith(key + "="):
+                return arg.removeprefix(key + "=")
+        return None
+
+
+class Client:
+    """
+    asyncio front end for comm.Serial. The port is watched with add_reader()
+    and the retransmit timer only runs while commands are waiting for an
+    acknowledgement, so an idle client only wakes up for the heartbeat.
+
+    If the Pi stops answering for heartbeat_timeout seconds, or the port goes
+    away, the client reconnects by itself: commands keep queueing meanwhile,
+    and once a new handshake is done the unacknowledged ones are sent again
+    and every Deck the Pi may have lost is synced. events() yields "link down"
+    and "link up" as that happens.
+
+        async with Client("/dev/ttyV0") as deck:
+            await deck.send("ui clean 8 5")
+            async for event in deck.events():
+                ...
+    """
+
+    def __init__(
+        self,
+        port: str,
+        binary: bool = True,
+        state_path: str | None = DEFAULT_STATE_PATH,
+        heartbeat_interval: float = HEARTBEAT_INTERVAL,
+        heartbeat_timeout: float = HEARTBEAT_TIMEOUT,
+        **kwargs,
+    ):
+        self.serial = comm.Serial(port=port, **kwargs)
+        self.serial.heartbeat = Heartbeat(heartbeat_interval, heartbeat_timeout)
+        self.binary = binary
+        self.connected = False
+        self._connected_at = 0.0
+        self._port_open = True
+        # The Pi's pages, as far as acknowledged commands tell; a page whose
+        # content isn't known is left out. Saved to state_path so a restarted
+        # host can still recognise the Pi's layout hash.
+        self.pages: dict[str, Layout] = {}
+        self.shown_page = DEFAULT_PAGE
+        self.state_path = state_path
+        # Page the acknowledged commands apply to, while inside "ui page begin".
+        self._edit_page: str | None = None
+        # Decks by page name, so a page the Pi has dropped can be sent again.
+        self.decks: dict = {}
+        self._resyncs: set[asyncio.Task] = set()
+        self._loop: asyncio.AbstractEventLoop | None = None
+        self._handshake: asyncio.Future | None = None
+        self._waiters: dict[int, tuple[list[str], asyncio.Future, float]] = {}
+        self._stats_replies: list[asyncio.Future] = []
+        self._events: asyncio.Queue[Event | None] = asyncio.Queue()
+        self._timer: asyncio.TimerHandle | None = None
+        self._beat_timer: asyncio.TimerHandle | None = None
+        self._init_line = ""
+        self.serial.on_ack = self._on_ack
+
+    async def __aenter__(self) -> "Client":
+        await self.connect()
+        return self
+
+    async def __aexit__(self, *exc):
+        self.close()
+
+    async def connect(self, timeout: float | None = None):
+        """Starts watching the port and waits for the Pi's handshake."""
+        if not self.serial.ser.is_open:
+            # Closed by close().
+            self.serial.reopen()
+            self._port_open = True
+        self._loop = asyncio.get_running_loop()
+        self._handshake = self._loop.create_future()
+        self._loop.add_reader(self.serial.fileno(), self._on_readable)
+        self.serial.request_handshake()
+        self._beat_timer = self._loop.call_later(self.serial.heartbeat.interval, self._on_beat)
+        # Anything already buffered arrived before the reader was added.
+        self._on_readable()
+        try:
+            await asyncio.wait_for(asyncio.shield(self._handshake), timeout)
+        except BaseException:
+            self.close()
+            raise
+
+    def close(self):
+        """
+        Stops watching the port and closes it, fails every command still
+        waiting for an acknowledgement and ends events().
+        """
+        if self._loop is None:
+            return
+        self.save_state()
+        if self._port_open:
+            self._loop.remove_reader(self.serial.fileno())
+        self.serial.ser.close()
+        self._port_open = False
+        for timer in (self._timer, self._beat_timer):
+            if timer is not None:
+                timer.cancel()
+        self._timer = self._beat_timer = None
+        for task in self._resyncs:
+            task.cancel()
+        for future in self._stats_replies:
+            if not future.done():
+                future.set_exception(CommandError("stats", "connection closed"))
+        self._stats_replies.clear()
+        for args, future, _ in self._waiters.values():
+            if not future.done():
+                future.set_exception(CommandError(shlex.join(args), "connection closed"))
+        self._waiters.clear()
+        if self._handshake is not None and not self._handshake.done():
+            self._handshake.cancel()
+        self._events.put_nowait(None)
+        self._loop = None
+        self.connected = False
+
+    def send(self, command: str) -> asyncio.Future:
+        """
+        Queues `command` right away, so commands keep their order even if the
+        caller doesn't await each one, and returns a future that resolves
+        once the Pi has applied it. A command the Pi couldn't parse or apply
+        raises CommandError.
+        """
+        self._check_connected()
+        try:
+            args = shlex.split(command)
+        except ValueError:
+            # The Pi will reject it as unparsable.
+            args = command.split()
+        return self._track(args, self.serial.send(command))
+
+    def send_icon(self, x: int, y: int, image: bytes, cached: bool = True) -> asyncio.Future:
+        """Like comm.Serial.send_icon(), awaitable like send()."""
+        self._check_connected()
+        key = "sha256:" + hashlib.sha256(image).hexdigest()
+        args = ["ui", "icon", str(x), str(y), key]
+        return self._track(args, self.serial.send_icon(x, y, image, cached))
+
+    @property
+    def link(self) -> dict:
+        """Round-trip time, jitter and lost pings of the heartbeat."""
+        return self.serial.heartbeat.to_dict()
+
+    async def stats(self, reset: bool = False) -> dict:
+        """
+        Latency histograms from both ends: the Pi's press hops and per command
+        parse/apply times under "pi", this host's under "host", and the link
+        quality under "link".
+        """
+        reply = self._loop.create_future()
+        self._stats_replies.append(reply)
+        await self.send("stats reset" if reset else "stats")
+        pi_stats = await reply
+        host_stats = STATS.to_dict()
+        if reset:
+            STATS.reset()
+        return {"pi": pi_stats, "host": host_stats, "link": self.link}
+
+    async def dump_stats(self, path: str, reset: bool = False):
+        """Writes stats() to `path` as JSON."""
+        data = await self.stats(reset)
+        with open(path, "w") as file:
+            json.dump(data, file, indent=2)
+
+    def save_state(self):
+        """Writes `pages` to state_path."""
+        if self.state_path is None or not self.pages:
+            return
+        try:
+            save_pages(self.state_path, self.pages, self.shown_page)
+        except OSError as e:
+            print(f"[WARN] Could not save layout state: {e}")
+
+    def _load_state(self) -> dict[str, Layout] | None:
+        if self.state_path is None:
+            return None
+        try:
+            return load_pages(self.state_path)[0]
+        except (OSError, ValueError, KeyError) as e:
+            if not isinstance(e, FileNotFoundError):
+                print(f"[WARN] Could not load layout state: {e}")
+            return None
+
+    def _match_state(self, line: str):
+        """Works out `pages` from the layout hash in the Pi's handshake."""
+        reported = None
+        for word in line.split():
+            if word.startswith("state="):
+                reported = word.removeprefix("state=")
+            if word.startswith("page="):
+                self.shown_page = word.removeprefix("page=")
+
+        known, self.pages = self.pages, {}
+        self._edit_page = None
+        if reported is None:
+            return
+        for candidate in (known, self._load_state(), {DEFAULT_PAGE: Layout()}):
+            if candidate and pages_hash(candidate) == reported:
+                self.pages = candidate
+                return
+
+    async def events(self):
+        """Yields an Event for each unsolicited line until close()."""
+        while True:
+            event = await self._events.get()
+            if event is None:
+                # Leave the sentinel for any other consumer.
+                self._events.put_nowait(None)
+                return
+            yield event
+
+    def _check_connected(self):
+        # Before anything is queued, or it would go out on the next connect.
+        if self._loop is None:
+            raise RuntimeError("Client is not connected")
+
+    def _track(self, args: list[str], seq: int) -> asyncio.Future:
+        future = self._loop.create_future()
+        self._waiters[seq] = (args, future, time.monotonic())
+        self._schedule()
+        return future
+
+    def _on_ack(self, seq: int, error: str | None):
+        args, future, sent_at = self._waiters.pop(seq, (None, None, 0.0))
+        if future is None:
+            return
+        if error is None:
+            STATS.record("command ack", time.monotonic() - sent_at)
+
+        page = self._edit_page or self.shown_page
+        if error is None:
+            if args[:3] == ["ui", "page", "begin"]:
+                self._edit_page = args[3]
+            elif args[:3] == ["ui", "page", "end"]:
+                self._edit_page = None
+            elif args[:2] == ["ui", "clean"] and page not in self.pages:
+                self.pages[page] = Layout()
+            if page in self.pages:
+                self.pages[page].apply(args)
+        elif error == "no ack" and args[:1] == ["ui"]:
+            # It may or may not have been applied.
+            self.pages.pop(page, None)
+
+        if future.done():
+            return
+        if error is None:
+            future.set_result(None)
+        else:
+            future.set_exception(CommandError(shlex.join(args), error))
+
+    def _on_readable(self):
+        try:
+            lines = self.serial.poll()
+        except OSError as e:
+            self._port_lost(e)
+            return
+        for line in lines:
+            if not self._handshake.done():
+                self._answer_handshake(line)
+                continue
+            if line.startswith("handshake stage1 init"):
+                if time.monotonic() - self._connected_at <= self.serial.heartbeat.timeout:
+                    # Sent again before our reply reached the Pi.
+                    continue
+                # The Pi started over, e.g. it was restarted.
+                self._link_lost()
+                self._answer_handshake(line)
+                continue
+            if line.startswith("error ") and not line.startswith("error 0 "):
+                # Already raised from the future returned by send().
+                continue
+            if self._handle_page_reply(line):
+                continue
+            if line.startswith("stats ") and self._stats_replies:
+                reply = self._stats_replies.pop(0)
+                if not reply.done():
+                    reply.set_result(json.loads(line.removeprefix("stats ")))
+                continue
+            self._events.put_nowait(Event.parse(line))
+        self._schedule()
+
+    def _answer_handshake(self, line: str):
+        if self.serial.verifying:
+            # Waiting for the Pi to answer at the new baud rate.
+            if self.serial.check_verified(line):
+                self._on_handshake(self._init_line)
+        elif self.serial.complete_handshake(line, self.binary, upgrade=True):
+            if self.serial.verifying:
+                self._init_line = line
+            else:
+                self._on_handshake(line)
+
+    def _on_handshake(self, line: str):
+        self._match_state(line)
+        self._handshake.set_result(None)
+        resumed = self._connected_at > 0
+        self._connected_at = time.monotonic()
+        self.serial.heartbeat.reset()
+        if self.connected:
+            return
+        self.connected = True
+        if not resumed:
+            return  # The first handshake, still inside connect().
+
+        # Picks up where the link went down.
+        self.serial.resend_unacked()
+        self.serial.resume_assets()
+        for name, deck in self.decks.items():
+            if name not in self.pages:
+                task = self._loop.create_task(deck.sync())
+                self._resyncs.add(task)
+                task.add_done_callback(self._resyncs.discard)
+        self._events.put_nowait(Event.parse("link up"))
+
+    def _link_lost(self):
+        """Holds back commands and starts asking for a new handshake."""
+        if not self.connected:
+            return
+        print("[WARN] Lost the link to the Pi, reconnecting")
+        self.connected = False
+        self.serial.paused = True
+        self._handshake = self._loop.create_future()
+        self._events.put_nowait(Event.parse("link down"))
+
+    def _port_lost(self, error: OSError):
+        if self._port_open:
+            print(f"[WARN] Serial port error: {error}")
+            self._loop.remove_reader(self.serial.fileno())
+            self._port_open = False
+        self._link_lost()
+
+    def _on_beat(self):
+        """Runs every heartbeat interval: pings, or tries to reconnect."""
+        heartbeat = self.serial.heartbeat
+        self._beat_timer = self._loop.call_later(heartbeat.interval, self._on_beat)
+        if self.connected and not heartbeat.alive():
+            self._link_lost()
+        try:
+            if not self._port_open:
+                self.serial.reopen()
+                self._loop.add_reader(self.serial.fileno(), self._on_readable)
+                self._port_open = True
+            if self.connected:
+                self.serial.send_raw(f"ping {heartbeat.ping()}")
+            elif not self.serial.verifying or not self.serial.retry_verify(heartbeat.timeout):
+                self.serial.request_handshake()
+        except OSError as e:
+            self._port_lost(e)
+
+    def _handle_page_reply(self, line: str) -> bool:
+        """
+        Keeps `pages` in step with "page evicted|miss|shown <name>". A page
+        the Pi was asked to show but doesn't have is sent again if a Deck for
+        it exists. Returns True if the line needs no further handling.
+        """
+        parts = line.split(" ")
+        if parts[0] != "page" or len(parts) != 3:
+            return False
+        kind, name = parts[1], parts[2]
+
+        if kind == "shown":
+            self.shown_page = name
+            return False  # Also worth an event.
+        if kind not in ("evicted", "miss"):
+            return False
+
+        self.pages.pop(name, None)
+        if kind == "evicted":
+            return True
+        deck = self.decks.get(name)
+        if deck is None:
+            return False
+        task = self._loop.create_task(deck.show())
+        self._resyncs.add(task)
+        task.add_done_callback(self._resyncs.discard)
+        return True
+
+    def _on_timer(self):
+        self._timer = None
+        self._on_readable()
+
+    def _schedule(self):
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        delay = self.serial.next_timeout()
+        if delay is not None and self._loop is not None:
+            self._timer = self._loop.call_later(delay, self._on_timer)
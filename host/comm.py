@@ -1,14 +1,66 @@
 import serial
 import time
+import base64
+import hashlib
+import random
+from collections import OrderedDict, deque
+from dataclasses import dataclass, field
+from typing import Callable
+import framing
+from heartbeat import Heartbeat
+
+# Asks the Pi for a new handshake whichever mode it is in: framed, then as a
+# plain line. The form the Pi doesn't expect is discarded as noise.
+HANDSHAKE_RESTART = (
+    framing.encode_frame(framing.FRAME_TEXT, b"handshake stage1 restart")
+    + b"\nhandshake stage1 restart\n"
+)
+
+# Icons larger than this are uploaded as chunked assets instead of in one piece.
+ASSET_CHUNK_SIZE = 2048
+
+
+@dataclass
+class _Pending:
+    """A sequenced command that has been written but not acknowledged yet."""
+
+    type: int
+    payload: bytes
+    encoded: bytes
+    sent_at: float
+    retries: int = 0
+
+
+@dataclass
+class _AssetUpload:
+    """A chunked upload in progress; see Serial.send_asset()."""
+
+    data: bytes
+    chunk_size: int
+    progress: Callable[[int, int], None] | None = None
+    acked_bytes: int = 0
+    # Set while a "begin" is outstanding, so a burst of "asset unknown"
+    # replies only restarts the transfer once.
+    restarting: bool = False
+    chunk_seqs: dict[int, int] = field(default_factory=dict)
+
+    def report(self):
+        if self.progress is not None:
+            self.progress(min(self.acked_bytes, len(self.data)), len(self.data))
 
 
 class Serial:
     def __init__(
         self,
         port="/dev/ttyACM0",
-        baudrate=115200,
+        baudrate=framing.BASE_BAUDRATE,
         timeout=1,
         verbose: bool | None = None,
+        window_size: int = 8,
+        ack_timeout: float = 1.0,
+        max_retries: int = 5,
+        baudrates: tuple[int, ...] = framing.BAUDRATES,
+        compression: bool = True,
     ):
         self.ser = serial.Serial(
             port=port,
@@ -20,31 +72,482 @@ class Serial:
         )
         self.verbose = verbose
 
+        # Switched on during the stage 1 handshake if both sides support it.
+        self.binary = False
+        self.compression = compression
+        self.compress = False
+
+        # The link can be moved from `baudrate` to a faster one of `baudrates`
+        # during the handshake. Until the Pi answers at the new rate,
+        # `verifying` is set; rates that failed aren't tried again.
+        self.base_baudrate = baudrate
+        self.baudrates = baudrates
+        self.failed_baudrates: set[int] = set()
+        self.verifying = False
+        self._verify_started = 0.0
+        self._frame_decoder = framing.FrameDecoder()
+        self._rx_buffer = bytearray()
+
+        # Sliding send window. Every command gets a sequence number; at most
+        # window_size of them may be unacknowledged at once, and any that stay
+        # unacknowledged for ack_timeout seconds are written again.
+        self.window_size = window_size
+        self.ack_timeout = ack_timeout
+        self.max_retries = max_retries
+        # Start somewhere random so a restarted host doesn't reuse sequence
+        # numbers the Pi has just seen from the previous session.
+        self._tx_seq = random.randint(1, 0xFFFF)
+        self._tx_queue: deque[tuple[int, int, bytes]] = deque()
+        self._unacked: OrderedDict[int, _Pending] = OrderedDict()
+        self._events: list[str] = []
+        # Called as on_ack(seq, error) once per sequenced command: error is
+        # None when it was applied, the Pi's reason when it was rejected, or
+        # "no ack" when the host gave up retransmitting it.
+        self.on_ack: Callable[[int, str | None], None] | None = None
+
+        # Image bytes of every icon sent by hash, so they can be uploaded when
+        # the Pi reports a cache miss.
+        self.icons: dict[str, bytes] = {}
+        self._icon_uploads: dict[str, int] = {}
+        self._asset_uploads: dict[str, _AssetUpload] = {}
+
+        self.heartbeat = Heartbeat()
+        # Set while the link is down: commands are still queued, but nothing
+        # is written or retransmitted until resend_unacked().
+        self.paused = False
+
         if self.verbose:
             print("[INFO] Serial port opened successfully")
 
-    def read(self):
-        if self.ser.in_waiting > 0:
-            data = (
-                self.ser.read(self.ser.in_waiting).decode("utf-8").rstrip()
-            )  # Read a line, decode, remove trailing newline
-            return data
+    def _receive(self) -> list[str]:
+        """Drains the serial port and returns every complete incoming line."""
+        if self.ser.in_waiting <= 0:
+            return []
+        raw = self.ser.read(self.ser.in_waiting)
+
+        if self.binary:
+            frames = self._frame_decoder.feed(raw)
+            if frames:
+                # Bytes alone could be a Pi that restarted in text mode.
+                self.heartbeat.heard()
+            return [
+                frame.payload.decode("utf-8", errors="replace").rstrip("\n")
+                for frame in frames
+                if frame.type == framing.FRAME_TEXT
+            ]
+
+        self._rx_buffer += raw
+        end = self._rx_buffer.rfind(b"\n")
+        if end == -1:
+            return []
+        lines = bytes(self._rx_buffer[:end]).decode("utf-8", errors="replace")
+        del self._rx_buffer[: end + 1]
+        self.heartbeat.heard()
+        return lines.split("\n")
+
+    def _handle_ack(self, line: str) -> bool:
+        """
+        Consumes "ok <seq>" and "error <seq> <reason>" replies. Returns False
+        for anything else so it can be passed on as an event.
+        """
+        parts = line.split(" ", 2)
+        if parts[0] not in ("ok", "error") or len(parts) < 2:
+            return False
+        try:
+            seq = int(parts[1])
+        except ValueError:
+            return False
+
+        if self._unacked.pop(seq, None) is not None and self.on_ack is not None:
+            error = None
+            if parts[0] == "error":
+                error = parts[2] if len(parts) > 2 else ""
+            self.on_ack(seq, error)
+        for key, upload_seq in list(self._icon_uploads.items()):
+            if upload_seq == seq:
+                del self._icon_uploads[key]
+        for upload in self._asset_uploads.values():
+            size = upload.chunk_seqs.pop(seq, None)
+            # A rejected chunk is sent again after "asset end".
+            if size is not None and parts[0] == "ok":
+                upload.acked_bytes += size
+                upload.report()
+        # Errors are still worth surfacing to the caller.
+        return parts[0] == "ok"
+
+    def _handle_heartbeat(self, line: str) -> bool:
+        """Answers the Pi's pings and times the replies to ours."""
+        parts = line.split(" ")
+        if len(parts) != 2 or parts[0] not in ("ping", "pong"):
+            return False
+        if parts[0] == "ping":
+            self.send_raw(f"pong {parts[1]}")
+        else:
+            self.heartbeat.pong(parts[1])
+        return True
+
+    def _handle_icon_miss(self, line: str) -> bool:
+        """Uploads the icon named by an "icon miss <hash>" reply."""
+        if not line.startswith("icon miss "):
+            return False
+        key = line.split(" ", 2)[2]
+        data = self.icons.get(key)
+        if data is None:
+            return False  # Not ours to answer; let the caller see it.
+        if key in self._icon_uploads or key in self._asset_uploads:
+            return True  # Several cells missed the same icon; upload it once.
+
+        if len(data) > ASSET_CHUNK_SIZE:
+            self.send_asset(data)
+            return True
+
+        if self.binary:
+            payload = bytes.fromhex(key.removeprefix("sha256:")) + data
+            seq = self._send_command(framing.FRAME_ICON_PUT, payload)
         else:
+            seq = self.send(f"icon put {key} {base64.b64encode(data).decode('ascii')}")
+        self._icon_uploads[key] = seq
+        return True
+
+    def _handle_asset_reply(self, line: str) -> bool:
+        """Drives chunked uploads from the Pi's "asset ..." replies."""
+        parts = line.split(" ")
+        if parts[0] != "asset" or len(parts) < 3:
+            return False
+        reply, key = parts[1], parts[2]
+        upload = self._asset_uploads.get(key)
+        if upload is None:
             return False
 
-    def send(self, data: str, end="\n"):
-        data = data.replace("\\", "\\\\").replace("\n", "\\n")
-        self.ser.write((data + end).encode("utf-8"))
-    
+        if reply == "resume":
+            upload.restarting = False
+            first = int(parts[3])
+            upload.acked_bytes = first * upload.chunk_size
+            upload.chunk_seqs.clear()
+            upload.report()
+            for index in range(first, -(-len(upload.data) // upload.chunk_size)):
+                chunk = upload.data[
+                    index * upload.chunk_size : (index + 1) * upload.chunk_size
+                ]
+                seq = self._send_chunk(key, index, chunk)
+                upload.chunk_seqs[seq] = len(chunk)
+            self.send(f"asset end {key}")
+        elif reply == "done":
+            del self._asset_uploads[key]
+            upload.acked_bytes = len(upload.data)
+            upload.report()
+        elif reply in ("corrupt", "unknown"):
+            if not upload.restarting:
+                self._begin_asset(key, upload)
+        elif reply == "refused":
+            del self._asset_uploads[key]
+            if self.verbose:
+                print(f"[WARN] The Pi refused asset {key}")
+        return True
+
+    def _send_chunk(self, key: str, index: int, chunk: bytes) -> int:
+        if self.binary:
+            digest = bytes.fromhex(key.removeprefix("sha256:"))
+            payload = framing.ASSET_CHUNK_HEADER.pack(digest, index) + chunk
+            return self._send_command(framing.FRAME_ASSET_CHUNK, payload)
+        encoded = base64.b64encode(chunk).decode("ascii")
+        return self.send(f"asset chunk {key} {index} {encoded}")
+
+    def _begin_asset(self, key: str, upload: _AssetUpload):
+        upload.restarting = True
+        self.send(f"asset begin {key} {len(upload.data)} {upload.chunk_size}")
+
+    def send_asset(
+        self,
+        data: bytes,
+        chunk_size: int = ASSET_CHUNK_SIZE,
+        progress: Callable[[int, int], None] | None = None,
+    ) -> str:
+        """
+        Uploads `data` to the Pi in numbered chunks and returns its content
+        hash. The Pi acknowledges every chunk and verifies the hash at the end;
+        `progress(sent_bytes, total_bytes)` is called as chunks are confirmed.
+        An interrupted upload continues where it stopped on resume_assets().
+        """
+        key = "sha256:" + hashlib.sha256(data).hexdigest()
+        if key not in self._asset_uploads:
+            upload = _AssetUpload(data, chunk_size, progress)
+            self._asset_uploads[key] = upload
+            self._begin_asset(key, upload)
+        return key
+
+    def resume_assets(self):
+        """Restarts every unfinished upload; the Pi keeps the chunks it has."""
+        for key, upload in self._asset_uploads.items():
+            self._begin_asset(key, upload)
+
+    def _next_seq(self) -> int:
+        self._tx_seq = self._tx_seq % 0xFFFF + 1  # 0 means "unsequenced"
+        return self._tx_seq
+
+    def _encode(self, type: int, payload: bytes, seq: int) -> bytes:
+        if self.binary:
+            return framing.encode_frame(type, payload, seq, self.compress)
+        line = payload.decode("utf-8")
+        if seq:
+            line = f"@{seq} {line}"
+        line = line.replace("\\", "\\\\").replace("\n", "\\n")
+        return (line + "\n").encode("utf-8")
+
+    def _first_unacked_seq(self) -> int:
+        """The oldest sequence number the Pi hasn't acknowledged yet."""
+        if self._unacked:
+            return next(iter(self._unacked))
+        if self._tx_queue:
+            return self._tx_queue[0][0]
+        return self._tx_seq % 0xFFFF + 1
+
+    def _pump(self):
+        if self.paused:
+            return
+        now = time.monotonic()
+
+        # The Pi applies commands strictly in order and drops whatever comes
+        # after one that went missing. So the first command that timed out is
+        # written again, followed by every unacknowledged command after it;
+        # only the first counts as a retry.
+        going_back = False
+        for seq, pending in list(self._unacked.items()):
+            if not going_back:
+                if now - pending.sent_at < self.ack_timeout:
+                    continue
+                going_back = True
+                if pending.retries >= self.max_retries:
+                    del self._unacked[seq]
+                    if self.verbose:
+                        print(f"[WARN] Giving up on command {seq} after {pending.retries} retries")
+                    # Or the Pi would keep waiting for it.
+                    self.send_raw(f"seq {seq % 0xFFFF + 1}")
+                    if self.on_ack is not None:
+                        self.on_ack(seq, "no ack")
+                    continue
+                pending.retries += 1
+            pending.sent_at = now
+            self.ser.write(pending.encoded)
+
+        while self._tx_queue and len(self._unacked) < self.window_size:
+            seq, type, payload = self._tx_queue.popleft()
+            encoded = self._encode(type, payload, seq)
+            self._unacked[seq] = _Pending(type, payload, encoded, now)
+            self.ser.write(encoded)
+
+    def resend_unacked(self):
+        """
+        Unpauses after a new handshake and writes every unacknowledged command
+        again at once, encoded for the mode that was just agreed on.
+        """
+        self.paused = False
+        now = time.monotonic()
+        for seq, pending in self._unacked.items():
+            pending.encoded = self._encode(pending.type, pending.payload, seq)
+            pending.sent_at = now
+            pending.retries = 0
+            self.ser.write(pending.encoded)
+        self._pump()
+
+    def poll(self) -> list[str]:
+        """
+        Processes acknowledgements, retransmits timed out commands, moves
+        queued commands into the send window and returns every other line
+        received from the Pi (broadcasts, errors, ...).
+        """
+        for line in self._receive():
+            if (
+                not line
+                or self._handle_ack(line)
+                or self._handle_heartbeat(line)
+                or self._handle_icon_miss(line)
+                or self._handle_asset_reply(line)
+            ):
+                continue
+            self._events.append(line)
+        self._pump()
+
+        events, self._events = self._events, []
+        return events
+
+    def read(self):
+        events = self.poll()
+        if events:
+            return "\n".join(events)
+        return False
+
+    def fileno(self) -> int:
+        """File descriptor of the port, for select() or an event loop."""
+        return self.ser.fileno()
+
+    def next_timeout(self) -> float | None:
+        """
+        Seconds until the oldest unacknowledged command is due to be written
+        again, or None if nothing is waiting for an acknowledgement.
+        """
+        if not self._unacked or self.paused:
+            return None
+        oldest = min(pending.sent_at for pending in self._unacked.values())
+        return max(0.0, oldest + self.ack_timeout - time.monotonic())
+
+    def pending(self) -> int:
+        """Number of commands queued or waiting for an acknowledgement."""
+        return len(self._tx_queue) + len(self._unacked)
+
+    def flush(self, timeout: float | None = None, delay=0.005) -> bool:
+        """
+        Blocks until every queued command has been acknowledged. Returns False
+        if `timeout` seconds pass first. Lines received meanwhile are kept for
+        the next poll().
+        """
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while self.pending():
+            self._events.extend(self.poll())
+            if deadline is not None and time.monotonic() > deadline:
+                return False
+            time.sleep(delay)
+        return True
+
+    def send_raw(self, data: str):
+        """Writes `data` immediately, without a sequence number or window."""
+        self.ser.write(self._encode(framing.FRAME_TEXT, data.encode("utf-8"), 0))
+
+    def _send_command(self, type: int, payload: bytes) -> int:
+        seq = self._next_seq()
+        self._tx_queue.append((seq, type, payload))
+        self._pump()
+        return seq
+
+    def send(self, data: str) -> int:
+        """Queues a command and returns the sequence number it was given."""
+        return self._send_command(framing.FRAME_TEXT, data.encode("utf-8"))
+
+    def send_icon(self, x: int, y: int, image: bytes, cached: bool = True) -> int:
+        """
+        Sets the icon of the button at (x, y) from the raw bytes of an image
+        file. By default only the content hash is sent, and the bytes follow
+        if the Pi doesn't have them cached yet. With cached=False the bytes
+        are sent inline: as-is in binary mode, otherwise as base64.
+        """
+        if cached:
+            key = "sha256:" + hashlib.sha256(image).hexdigest()
+            self.icons[key] = image
+            return self.send(f"ui icon {x} {y} {key}")
+
+        if self.binary:
+            payload = framing.ICON_HEADER.pack(x, y) + image
+            return self._send_command(framing.FRAME_ICON, payload)
+        return self.send(f"ui icon {x} {y} {base64.b64encode(image).decode('ascii')}")
+
     def wait_for_connection_stage1(
-        self, iterations: int | None = None, delay=0.5
+        self, iterations: int | None = None, delay=0.5, binary: bool = False
     ):
         iters_done = 0
         while (iterations is None) or (iters_done <= iterations):
             iters_done += 1
             data = self.read()
-            if "handshake stage1 init" in str(data):
-                self.send("handshake stage1 complete")
+            if self.complete_handshake(str(data), binary):
                 return True
             time.sleep(delay)
         return False
+
+    def reopen(self):
+        """Closes and opens the port again, e.g. after the device went away."""
+        self.ser.close()
+        self.ser.open()
+        self._rx_buffer.clear()
+        self._frame_decoder = framing.FrameDecoder()
+
+    def request_handshake(self):
+        """
+        Asks a Pi that is already past the handshake, e.g. after the host was
+        restarted, to start a new one. See HANDSHAKE_RESTART. The new
+        handshake starts at the base baud rate.
+        """
+        self.ser.write(HANDSHAKE_RESTART)
+        self._reset_link()
+
+    def _reset_link(self):
+        self.binary = False
+        self.compress = False
+        self.verifying = False
+        self._frame_decoder = framing.FrameDecoder()
+        if self.ser.baudrate != self.base_baudrate:
+            self.ser.flush()
+            self.ser.baudrate = self.base_baudrate
+
+    def complete_handshake(self, data: str, binary: bool = False, upgrade: bool = False) -> bool:
+        """
+        Answers a "handshake stage1 init" found in `data`, opting into binary
+        framing (and compression) if asked for and offered. Returns False if
+        there was none.
+
+        With upgrade=True, the fastest baud rate both sides support is also
+        agreed on and `verifying` is set: the handshake is only done once
+        check_verified() sees the Pi's answer at that rate.
+        """
+        if "handshake stage1 init" not in data:
+            return False
+        # The Pi always announces itself at the base rate.
+        self._reset_link()
+        # The Pi lists its optional capabilities after "init".
+        offered = data.split()
+        reply = ["handshake", "stage1", "complete"]
+        if binary and "binary" in offered:
+            reply.append("binary")
+            if self.compression and "zlib" in offered:
+                reply.append("zlib")
+        baudrate = self._pick_baudrate(offered) if upgrade else self.base_baudrate
+        if baudrate != self.base_baudrate:
+            reply.append(f"baud={baudrate}")
+        # Where the Pi's in-order check starts; unacknowledged commands are
+        # sent again after the handshake.
+        reply.append(f"seq={self._first_unacked_seq()}")
+
+        self.send_raw(" ".join(reply))
+        self.binary = "binary" in reply
+        self.compress = "zlib" in reply
+        if baudrate != self.base_baudrate:
+            # The reply still has to go out at the old rate.
+            self.ser.flush()
+            self.ser.baudrate = baudrate
+            self.verifying = True
+            self._verify_started = time.monotonic()
+            self.send_raw("handshake stage1 verify")
+        return True
+
+    def _pick_baudrate(self, offered: list[str]) -> int:
+        rates = set()
+        for token in offered:
+            if token.startswith("baud="):
+                try:
+                    rates.update(int(rate) for rate in token.removeprefix("baud=").split(","))
+                except ValueError:
+                    pass
+        usable = (rates & set(self.baudrates)) - self.failed_baudrates
+        return max(usable, default=self.base_baudrate)
+
+    def check_verified(self, line: str) -> bool:
+        """Returns True, ending `verifying`, if `line` is the Pi's answer."""
+        if not self.verifying or line != "handshake stage1 verified":
+            return False
+        self.verifying = False
+        if self.verbose:
+            print(f"[INFO] Link running at {self.ser.baudrate} baud")
+        return True
+
+    def retry_verify(self, timeout: float) -> bool:
+        """
+        Asks the Pi to answer at the new baud rate again, the Pi may have
+        switched after the last request arrived. After `timeout` seconds the
+        rate is given up on: the link falls back to the base rate, where the
+        Pi also returns, and False is returned so a new handshake can start.
+        """
+        if time.monotonic() - self._verify_started < timeout:
+            self.send_raw("handshake stage1 verify")
+            return True
+        print(f"[WARN] No answer at {self.ser.baudrate} baud, falling back")
+        self.failed_baudrates.add(self.ser.baudrate)
+        self._reset_link()
+        return False
@@ -0,0 +1,108 @@
+import asyncio
+import hashlib
+from client import Client
+from layout import DEFAULT_PAGE, PAGE_NAME, Layout
+
+
+class Deck:
+    """
+    The layout the host wants one page of the deck to show. Build or edit it
+    with the methods below, then await sync(): only the cells that differ
+    from what the Pi already has are sent, and nothing at all if they match.
+
+        deck = Deck(client)
+        deck.clean(8, 5)
+        deck.button(0, 0, "Hello", broadcast="hello")
+        deck.button(1, 0, "More", dispatch="page:more")
+        await deck.sync()
+
+    Pages other than the main one are built on the Pi in the background and
+    kept there, so switching to one with show() or a "page:<name>" dispatch
+    is instant. Use "page:back" to return to the previous page.
+
+    A color or icon that sync() finds on several cells is sent as one region
+    command (e.g. "ui bgcolor rect 0 0 8 2 #FF0000"), so a dashboard can
+    repaint lots of cells at a time cheaply.
+    """
+
+    def __init__(self, client: Client, page: str = DEFAULT_PAGE):
+        if not PAGE_NAME.fullmatch(page):
+            raise ValueError(f"Invalid page name {page!r}")
+        self.client = client
+        self.page = page
+        self.layout = Layout()
+        client.decks[page] = self
+
+    def clean(self, width: int, height: int):
+        self.layout.clean(width, height)
+
+    def button(
+        self,
+        x: int,
+        y: int,
+        text: str,
+        x_span: int = 1,
+        y_span: int = 1,
+        broadcast: str | None = None,
+        dispatch: str = "nop",
+    ):
+        """A button that broadcasts `broadcast` when pressed, or dispatches `dispatch`."""
+        if broadcast is not None:
+            self.layout.set_button(x, y, text, x_span, y_span, "broadcast", broadcast)
+        else:
+            self.layout.set_button(x, y, text, x_span, y_span, "dispatch", dispatch)
+
+    def bgcolor(self, x: int, y: int, color: str):
+        self.layout.set_color(x, y, "bgcolor", color)
+
+    def textcolor(self, x: int, y: int, color: str):
+        self.layout.set_color(x, y, "textcolor", color)
+
+    def text(self, x: int, y: int, text: str):
+        """Changes just the text of the button at (x, y)."""
+        self.layout.set_text(x, y, text)
+
+    def icon(self, x: int, y: int, image: bytes):
+        """Sets the icon from the bytes of an image file."""
+        key = "sha256:" + hashlib.sha256(image).hexdigest()
+        # Uploaded from here if the Pi doesn't have it cached.
+        self.client.serial.icons[key] = image
+        self.layout.set_icon(x, y, key)
+
+    def reset(self, x: int, y: int):
+        self.layout.reset_cell(x, y)
+
+    async def sync(self) -> int:
+        """
+        Sends whatever it takes to make the Pi show this layout and waits for
+        it to be applied. Returns the number of cell commands that were
+        needed, not counting the batch and page commands around them.
+        """
+        remote = self.client.pages.get(self.page)
+        if remote is None:
+            commands = self.layout.commands()
+        else:
+            commands = remote.diff(self.layout)
+        if not commands:
+            return 0
+        count = len(commands)
+
+        # One command, even a region, is applied in a single call and painted
+        # in one frame. Several may be applied over several ticks, and so
+        # painted in several frames, so they are batched to show them all at
+        # once. Committing a batch repaints the whole grid, which costs more
+        # than repainting just the changed cells.
+        wrapped = commands
+        if count > 1:
+            wrapped = ["ui batch begin", *wrapped, "ui batch commit"]
+        if self.page != self.client.shown_page:
+            # Otherwise the commands would land on the shown page.
+            wrapped = [f"ui page begin {self.page}", *wrapped, "ui page end"]
+        await asyncio.gather(*(self.client.send(command) for command in wrapped))
+        self.client.save_state()
+        return count
+
+    async def show(self):
+        """Makes sure the Pi has this page, then switches to it."""
+        await self.sync()
+        await self.client.send(f"ui page show {self.page}")
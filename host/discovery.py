@@ -0,0 +1,156 @@
+import asyncio
+import fnmatch
+import glob
+import os
+import serial
+from serial.tools import list_ports
+import comm
+
+# The port the Pi was last found on, probed a little before the others.
+CACHE_PATH = os.path.join(
+    os.environ.get("XDG_CACHE_HOME", os.path.expanduser("~/.cache")), "pideck", "port"
+)
+
+# Ports a Pi can be on besides USB ones: its own UART, and virtual ports such
+# as the ones pi4/socat.sh creates, which list_ports can't see. Probing writes
+# to ports that stay silent, so other devices (modems, GPS, ...) are left out.
+PORT_PATTERNS = ("/dev/ttyUSB*", "/dev/ttyACM*", "/dev/ttyAMA*", "/dev/cu.usb*", "/dev/ttyV*")
+
+PROBE_TIMEOUT = 0.5
+# A Pi waiting for a host announces itself every 100 ms, so one on the cached
+# port is usually found before any other port is opened.
+CACHED_HEAD_START = 0.1
+# A Pi waiting for a host announces itself every 100 ms, so a port is only
+# written to (to wake up a Pi that is past the handshake) if it stays silent
+# this long.
+LISTEN_FIRST = 0.15
+
+HANDSHAKE_INIT = b"handshake stage1 init"
+
+
+def candidate_ports(patterns: tuple[str, ...] = PORT_PATTERNS) -> list[str]:
+    """
+    Serial ports that might have a Pi on the other end: USB ones, and any
+    matching `patterns`.
+    """
+    ports = [
+        info.device
+        for info in list_ports.comports()
+        if info.vid is not None
+        or any(fnmatch.fnmatch(info.device, pattern) for pattern in patterns)
+    ]
+    for pattern in patterns:
+        ports += sorted(glob.glob(pattern))
+    return list(dict.fromkeys(ports))
+
+
+async def probe(port: str, timeout: float = PROBE_TIMEOUT, baudrate: int = 115200) -> bool:
+    """
+    Returns True if a Pi announces a stage 1 handshake on `port` within
+    `timeout` seconds. The handshake itself is left to the Client.
+    """
+    loop = asyncio.get_running_loop()
+    try:
+        ser = serial.Serial(port, baudrate, timeout=0, write_timeout=0, exclusive=True)
+        # Whatever is buffered may be from long ago.
+        ser.reset_input_buffer()
+    except (OSError, ValueError):
+        return False
+
+    found = loop.create_future()
+    received = bytearray()
+
+    def on_readable():
+        try:
+            received.extend(ser.read(ser.in_waiting or 1))
+        except OSError:
+            if not found.done():
+                found.set_result(False)
+            return
+        if HANDSHAKE_INIT in received and not found.done():
+            found.set_result(True)
+        # Keep enough for the marker to be split across reads.
+        del received[: -len(HANDSHAKE_INIT)]
+
+    try:
+        loop.add_reader(ser.fileno(), on_readable)
+        try:
+            try:
+                return await asyncio.wait_for(asyncio.shield(found), LISTEN_FIRST)
+            except asyncio.TimeoutError:
+                ser.write(comm.HANDSHAKE_RESTART)
+                return await asyncio.wait_for(found, max(0.0, timeout - LISTEN_FIRST))
+        finally:
+            loop.remove_reader(ser.fileno())
+    except (asyncio.TimeoutError, OSError):
+        return False
+    finally:
+        ser.close()
+
+
+async def find_port(
+    timeout: float = PROBE_TIMEOUT,
+    cache_path: str | None = CACHE_PATH,
+    baudrate: int = 115200,
+    patterns: tuple[str, ...] = PORT_PATTERNS,
+) -> str | None:
+    """
+    Finds the port a Pi is on by probing every candidate_ports() at once,
+    the cached one with a short head start. The winner is cached for the
+    next start. Returns None if no Pi answered.
+
+        port = os.environ.get("PIDECK_PORT") or await find_port()
+    """
+    cached = _read_cache(cache_path)
+
+    async def probe_port(port: str) -> str | None:
+        return port if await probe(port, timeout, baudrate) else None
+
+    probes = []
+    if cached is not None:
+        probes.append(asyncio.create_task(probe_port(cached)))
+        done, _ = await asyncio.wait(probes, timeout=CACHED_HEAD_START)
+        if done and probes[0].result() is not None:
+            return cached
+
+    probes += [
+        asyncio.create_task(probe_port(port))
+        for port in candidate_ports(patterns)
+        if port != cached
+    ]
+    found = None
+    try:
+        for next_done in asyncio.as_completed(probes):
+            found = await next_done
+            if found is not None:
+                break
+    finally:
+        for task in probes:
+            task.cancel()
+        # Let the cancelled probes close their ports.
+        await asyncio.gather(*probes, return_exceptions=True)
+
+    if found is not None and found != cached:
+        _write_cache(cache_path, found)
+    return found
+
+
+def _read_cache(path: str | None) -> str | None:
+    if path is None:
+        return None
+    try:
+        with open(path) as file:
+            return file.read().strip() or None
+    except OSError:
+        return None
+
+
+def _write_cache(path: str | None, port: str):
+    if path is None:
+        return
+    try:
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, "w") as file:
+            file.write(port + "\n")
+    except OSError as e:
+        print(f"[WARN] Could not cache the port: {e}")
@@ -0,0 +1,118 @@
+import struct
+import zlib
+from typing import NamedTuple
+
+# Binary frame layout (all integers big-endian):
+#
+#   magic (2) | type (1) | seq (2) | length (4) | payload (length) | crc32 (4)
+#
+# The CRC covers everything after the magic up to the end of the payload.
+# With FLAG_ZLIB set in the type, the payload is zlib compressed; both ends
+# only send such frames if "zlib" was agreed on in the handshake.
+MAGIC = b"\xa5\x5a"
+HEADER = struct.Struct(">2sBHI")
+CRC = struct.Struct(">I")
+
+FRAME_TEXT = 0x01  # payload is a UTF-8 command line, no escaping needed
+FRAME_ICON = 0x02  # payload is x (u16), y (u16), then the raw image bytes
+FRAME_ICON_PUT = 0x03  # payload is the 32 byte sha256 digest, then the image bytes
+FRAME_ASSET_CHUNK = 0x04  # payload is the asset's sha256 digest, index (u32), data
+
+FLAG_ZLIB = 0x80
+# Smaller payloads rarely shrink enough to be worth compressing.
+COMPRESS_MIN = 128
+
+ICON_HEADER = struct.Struct(">HH")
+ICON_DIGEST_SIZE = 32
+ASSET_CHUNK_HEADER = struct.Struct(">32sI")
+
+MAX_PAYLOAD = 1024 * 1024
+
+# Every link starts at BASE_BAUDRATE; the handshake can move it to the highest
+# of BAUDRATES both ends support. A side that hears nothing valid for a while
+# after the switch goes back to BASE_BAUDRATE and handshakes again.
+BASE_BAUDRATE = 115200
+BAUDRATES = (115200, 230400, 460800, 921600)
+
+
+class Frame(NamedTuple):
+    type: int
+    seq: int
+    payload: bytes
+
+
+def encode_frame(type: int, payload: bytes, seq: int = 0, compress: bool = False) -> bytes:
+    if compress and len(payload) >= COMPRESS_MIN:
+        compressed = zlib.compress(payload)
+        if len(compressed) < len(payload):
+            type |= FLAG_ZLIB
+            payload = compressed
+    header = HEADER.pack(MAGIC, type, seq & 0xFFFF, len(payload))
+    crc = zlib.crc32(payload, zlib.crc32(header[len(MAGIC) :]))
+    return header + payload + CRC.pack(crc)
+
+
+class FrameDecoder:
+    """
+    Incrementally turns a byte stream into Frames. Bytes that are not part of a
+    valid frame (line noise, leftover text-mode output, corrupted frames) are
+    skipped by resynchronising on the next magic sequence.
+    """
+
+    def __init__(self, max_payload: int = MAX_PAYLOAD):
+        self.max_payload = max_payload
+        self.errors = 0
+        self._buffer = bytearray()
+
+    def feed(self, data: bytes) -> list[Frame]:
+        buf = self._buffer
+        buf += data
+        frames = []
+        pos = 0
+
+        while True:
+            start = buf.find(MAGIC, pos)
+            if start == -1:
+                # Keep a trailing byte that could be the first half of MAGIC.
+                pos = max(pos, len(buf) - 1 if buf.endswith(MAGIC[:1]) else len(buf))
+                break
+
+            if len(buf) - start < HEADER.size:
+                pos = start
+                break
+
+            _, type, seq, length = HEADER.unpack_from(buf, start)
+            if length > self.max_payload:
+                self.errors += 1
+                pos = start + 1
+                continue
+
+            payload_start = start + HEADER.size
+            end = payload_start + length + CRC.size
+            if len(buf) < end:
+                pos = start
+                break
+
+            payload = bytes(buf[payload_start : end - CRC.size])
+            (crc,) = CRC.unpack_from(buf, end - CRC.size)
+            header = bytes(buf[start + len(MAGIC) : payload_start])
+            if zlib.crc32(payload, zlib.crc32(header)) != crc:
+                self.errors += 1
+                pos = start + 1
+                continue
+
+            pos = end
+            if type & FLAG_ZLIB:
+                try:
+                    decompressor = zlib.decompressobj()
+                    payload = decompressor.decompress(payload, self.max_payload)
+                except zlib.error:
+                    payload = None
+                if payload is None or decompressor.unconsumed_tail:
+                    self.errors += 1
+                    continue
+                type &= ~FLAG_ZLIB
+            frames.append(Frame(type, seq, payload))
+
+        del buf[:pos]
+        return frames
@@ -0,0 +1,97 @@
+import time
+from collections import OrderedDict
+from stats import STATS
+
+# Link liveness and round-trip times, kept by both the host and the Pi. Keep
+# this file identical on both sides.
+
+# Seconds between pings, and of silence before the other side counts as gone.
+HEARTBEAT_INTERVAL = 0.25
+HEARTBEAT_TIMEOUT = 1.0
+
+# Weight of each new sample in the moving averages, as TCP uses for its RTT.
+RTT_ALPHA = 0.125
+
+# Pings remembered while waiting for their pong; older ones count as lost.
+MAX_OUTSTANDING = 16
+
+
+class Heartbeat:
+    """
+    Both ends send "ping <token>" every `interval` seconds and answer the
+    other's pings with "pong <token>". Any received byte counts as a sign of
+    life, so a link busy with a long upload isn't taken for a dead one; the
+    pongs time the round trip.
+    """
+
+    def __init__(self, interval: float = HEARTBEAT_INTERVAL, timeout: float = HEARTBEAT_TIMEOUT):
+        self.interval = interval
+        self.timeout = timeout
+        # Moving average of the round-trip time, and of how much consecutive
+        # samples differ from each other (jitter, as in RFC 3550), in seconds.
+        self.rtt: float | None = None
+        self.jitter = 0.0
+        self.last_rtt: float | None = None
+        self.sent = 0
+        self.received = 0
+        self.last_heard = time.monotonic()
+        self._next_token = 1
+        self._outstanding: OrderedDict[int, float] = OrderedDict()
+
+    def heard(self, now: float | None = None):
+        self.last_heard = time.monotonic() if now is None else now
+
+    def alive(self, now: float | None = None) -> bool:
+        now = time.monotonic() if now is None else now
+        return now - self.last_heard <= self.timeout
+
+    def ping(self, now: float | None = None) -> int:
+        """Returns the token for the next ping."""
+        token = self._next_token
+        self._next_token = self._next_token % 0xFFFF + 1
+        self._outstanding[token] = time.monotonic() if now is None else now
+        if len(self._outstanding) > MAX_OUTSTANDING:
+            self._outstanding.popitem(last=False)
+        self.sent += 1
+        return token
+
+    def pong(self, token: str, now: float | None = None) -> float | None:
+        """Records the pong for `token` and returns its round-trip time."""
+        try:
+            sent_at = self._outstanding.pop(int(token), None)
+        except ValueError:
+            return None
+        if sent_at is None:
+            return None
+        now = time.monotonic() if now is None else now
+        rtt = now - sent_at
+        self.heard(now)
+        self.received += 1
+        STATS.record("heartbeat rtt", rtt)
+
+        if self.rtt is None:
+            self.rtt = rtt
+        else:
+            self.jitter += (abs(rtt - self.last_rtt) - self.jitter) * RTT_ALPHA
+            self.rtt += (rtt - self.rtt) * RTT_ALPHA
+        self.last_rtt = rtt
+        return rtt
+
+    def reset(self):
+        """Starts over after a new handshake; the averages are kept."""
+        self.heard()
+        self._outstanding.clear()
+
+    def to_dict(self) -> dict:
+        def ms(seconds):
+            return None if seconds is None else seconds * 1000
+
+        return {
+            "rtt_ms": ms(self.rtt),
+            "jitter_ms": ms(self.jitter),
+            "last_rtt_ms": ms(self.last_rtt),
+            "sent": self.sent,
+            "received": self.received,
+            "lost": self.sent - self.received - len(self._outstanding),
+            "alive": self.alive(),
+        }
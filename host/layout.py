@@ -0,0 +1,273 @@
+import copy
+import hashlib
+import json
+import os
+import re
+import shlex
+
+# What the deck shows, in a form both ends can compare. The host keeps one in
+# step with the commands the Pi has acknowledged and the Pi keeps one in step
+# with the commands it has applied, so equal hashes mean equal screens and the
+# host only has to send the difference. Keep this file identical on both sides.
+#
+# A cell that isn't blank is a dict with any of:
+#
+#   "button":    [text, x_span, y_span, "broadcast" | "dispatch", message]
+#   "bgcolor":   color string
+#   "textcolor": color string
+#   "icon":      "sha256:<hex>"
+CELL_FIELDS = ("button", "bgcolor", "textcolor", "icon")
+
+Cell = tuple[int, int]
+
+# "ui bgcolor|textcolor|icon|text" also take a region instead of "x y", to
+# set one value on many cells in one command:
+#
+#   ui bgcolor all #FF0000
+#   ui bgcolor rect <x> <y> <width> <height> #FF0000
+#   ui bgcolor cells <x>,<y> <x>,<y> ... #FF0000
+#
+# Cells outside the grid are skipped. "ui text" keeps the rest of a button.
+REGIONS = ("all", "rect", "cells")
+REGION_VERBS = ("ui bgcolor", "ui textcolor", "ui icon", "ui text")
+# Fields that Layout.diff() sends as region commands when cells share a value.
+REGION_FIELDS = ("bgcolor", "textcolor", "icon")
+# Largest rect accepted, so a typo can't expand into millions of cells.
+MAX_REGION_CELLS = 4096
+
+# The Pi can hold several named pages; the one it starts with is "main".
+DEFAULT_PAGE = "main"
+PAGE_NAME = re.compile(r"[A-Za-z0-9_.-]+")
+
+
+class Layout:
+    def __init__(self):
+        # None until the first "ui clean"; the Pi is still on its loading screen.
+        self.size: tuple[int, int] | None = None
+        self.cells: dict[Cell, dict] = {}
+
+    def copy(self) -> "Layout":
+        return copy.deepcopy(self)
+
+    def clean(self, width: int, height: int):
+        self.size = (width, height)
+        self.cells.clear()
+
+    def _set(self, x: int, y: int, field: str, value):
+        self.cells.setdefault((x, y), {})[field] = value
+
+    def set_button(
+        self, x: int, y: int, text: str, x_span: int, y_span: int, kind: str, message: str
+    ):
+        self._set(x, y, "button", [text, x_span, y_span, kind, message])
+
+    def set_color(self, x: int, y: int, field: str, color: str):
+        """`field` is "bgcolor" or "textcolor"."""
+        self._set(x, y, field, color)
+
+    def set_icon(self, x: int, y: int, key: str):
+        self._set(x, y, "icon", key)
+
+    def set_text(self, x: int, y: int, text: str):
+        """Changes a button's text only; a blank cell gets a button that does nothing."""
+        button = self.cells.get((x, y), {}).get("button")
+        if button is None:
+            self.set_button(x, y, text, 1, 1, "dispatch", "nop")
+        else:
+            self._set(x, y, "button", [text, *button[1:]])
+
+    def set_field(self, x: int, y: int, field: str, value: str):
+        """`field` is "bgcolor", "textcolor", "icon" or "text"."""
+        if field == "text":
+            self.set_text(x, y, value)
+        else:
+            self._set(x, y, field, value)
+
+    def region(self, cells: list[Cell] | None) -> list[Cell]:
+        """The cells of a parse_region() result that are on the grid."""
+        if self.size is None:
+            return []
+        width, height = self.size
+        if cells is None:
+            return [(x, y) for y in range(height) for x in range(width)]
+        return [(x, y) for x, y in cells if 0 <= x < width and 0 <= y < height]
+
+    def reset_cell(self, x: int, y: int):
+        self.cells.pop((x, y), None)
+
+    def apply(self, args: list[str]):
+        """Updates the layout for a tokenized command; others are ignored."""
+        verb = " ".join(args[:2])
+        if verb in REGION_VERBS and args[2] in REGIONS:
+            for x, y in self.region(parse_region(args[2:-1])):
+                self.set_field(x, y, args[1], args[-1])
+        elif verb == "ui clean":
+            self.clean(int(args[2]), int(args[3]))
+        elif verb == "ui button":
+            self.set_button(
+                int(args[2]), int(args[3]), args[6], int(args[4]), int(args[5]), args[7], args[8]
+            )
+        elif verb in ("ui bgcolor", "ui textcolor"):
+            self.set_color(int(args[2]), int(args[3]), args[1], args[4])
+        elif verb == "ui icon" and args[4].startswith("sha256:"):
+            self.set_icon(int(args[2]), int(args[3]), args[4])
+        elif verb == "ui text":
+            self.set_text(int(args[2]), int(args[3]), args[4])
+        elif verb == "ui reset":
+            self.reset_cell(int(args[2]), int(args[3]))
+
+    def to_dict(self) -> dict:
+        return {
+            "size": None if self.size is None else list(self.size),
+            "cells": {f"{x},{y}": cell for (x, y), cell in self.cells.items()},
+        }
+
+    @classmethod
+    def from_dict(cls, data: dict) -> "Layout":
+        layout = cls()
+        if data["size"] is not None:
+            layout.size = tuple(data["size"])
+        for key, cell in data["cells"].items():
+            x, y = key.split(",")
+            layout.cells[int(x), int(y)] = cell
+        return layout
+
+    def hash(self) -> str:
+        """sha256 of the canonical JSON form, as "sha256:<hex>"."""
+        canonical = json.dumps(self.to_dict(), sort_keys=True, separators=(",", ":"))
+        return "sha256:" + hashlib.sha256(canonical.encode("utf-8")).hexdigest()
+
+    def cell_commands(self, x: int, y: int) -> list[str]:
+        """Commands that draw cell (x, y) on top of a blank cell."""
+        return [_field_command(*change) for change in self._cell_changes(x, y)]
+
+    def _cell_changes(self, x: int, y: int) -> list[tuple]:
+        cell = self.cells.get((x, y), {})
+        return [(x, y, field, cell[field]) for field in CELL_FIELDS if field in cell]
+
+    def commands(self) -> list[str]:
+        """Commands that draw the whole layout from scratch."""
+        if self.size is None:
+            return []
+        changes = []
+        for x, y in sorted(self.cells):
+            changes += self._cell_changes(x, y)
+        return [f"ui clean {self.size[0]} {self.size[1]}", *self._compact(changes)]
+
+    def diff(self, target: "Layout") -> list[str]:
+        """The shortest run of commands that turns this layout into `target`."""
+        if self.size != target.size:
+            return target.commands()
+
+        changes = []
+        for x, y in sorted(self.cells.keys() | target.cells.keys()):
+            old = self.cells.get((x, y), {})
+            new = target.cells.get((x, y), {})
+            if old == new:
+                continue
+            if any(field not in new for field in old):
+                # There is no command to unset a single field.
+                changes.append((x, y, "reset", None))
+                changes += target._cell_changes(x, y)
+                continue
+            for field in CELL_FIELDS:
+                if field in new and old.get(field) != new[field]:
+                    changes.append((x, y, field, new[field]))
+        return self._compact(changes)
+
+    def _compact(self, changes: list[tuple]) -> list[str]:
+        """
+        Commands for a list of (x, y, field, value) changes. A value that
+        several cells get is set with one region command, after the per cell
+        commands so it lands on top of any reset.
+        """
+        commands = []
+        groups: dict[tuple[str, str], list[Cell]] = {}
+        for x, y, field, value in changes:
+            if field in REGION_FIELDS:
+                groups.setdefault((field, value), []).append((x, y))
+            else:
+                commands.append(_field_command(x, y, field, value))
+        for (field, value), cells in groups.items():
+            if len(cells) == 1:
+                commands.append(_field_command(*cells[0], field, value))
+            else:
+                region = region_tokens(cells, self.size)
+                commands.append(shlex.join(["ui", field, *region, value]))
+        return commands
+
+
+def parse_region(tokens: list[str]) -> list[Cell] | None:
+    """
+    The cells a region names, without checking them against a grid; None
+    stands for "all". Raises ValueError if `tokens` aren't a region.
+    """
+    kind = tokens[0] if tokens else None
+    if kind == "all" and len(tokens) == 1:
+        return None
+    if kind == "rect" and len(tokens) == 5:
+        x, y, width, height = (int(token) for token in tokens[1:])
+        if width < 1 or height < 1 or width * height > MAX_REGION_CELLS:
+            raise ValueError(f"Invalid rect size {width}x{height}")
+        return [(cx, cy) for cy in range(y, y + height) for cx in range(x, x + width)]
+    if kind == "cells" and len(tokens) > 1:
+        cells = []
+        for token in tokens[1:]:
+            x, y = token.split(",")
+            cells.append((int(x), int(y)))
+        return cells
+    raise ValueError(f"Invalid region {' '.join(tokens)!r}")
+
+
+def region_tokens(cells: list[Cell], size: tuple[int, int]) -> list[str]:
+    """The shortest region naming exactly `cells`, for parse_region()."""
+    xs = [x for x, _ in cells]
+    ys = [y for _, y in cells]
+    left, top = min(xs), min(ys)
+    width, height = max(xs) - left + 1, max(ys) - top + 1
+    if len(set(cells)) == width * height:
+        if (left, top, width, height) == (0, 0, *size):
+            return ["all"]
+        return ["rect", str(left), str(top), str(width), str(height)]
+    return ["cells", *(f"{x},{y}" for x, y in cells)]
+
+
+def _field_command(x: int, y: int, field: str, value) -> str:
+    if field == "reset":
+        return f"ui reset {x} {y}"
+    if field == "button":
+        text, x_span, y_span, kind, message = value
+        return shlex.join(
+            ["ui", "button", str(x), str(y), str(x_span), str(y_span), text, kind, message]
+        )
+    return shlex.join(["ui", field, str(x), str(y), value])
+
+
+def pages_hash(pages: dict[str, Layout]) -> str:
+    """
+    Hash over every page, for the handshake. Which page is shown isn't part
+    of it, since that changes on the Pi without the host being involved.
+    """
+    hashes = {name: layout.hash() for name, layout in pages.items()}
+    canonical = json.dumps(hashes, sort_keys=True, separators=(",", ":"))
+    return "sha256:" + hashlib.sha256(canonical.encode("utf-8")).hexdigest()
+
+
+def save_pages(path: str, pages: dict[str, Layout], shown: str):
+    """Writes `pages` and the name of the shown one to `path`, atomically."""
+    data = {"shown": shown, "pages": {name: layout.to_dict() for name, layout in pages.items()}}
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path + ".tmp", "w") as file:
+        json.dump(data, file, separators=(",", ":"))
+    os.replace(path + ".tmp", path)
+
+
+def load_pages(path: str) -> tuple[dict[str, Layout], str]:
+    """Reads what save_pages() wrote, as (pages, shown)."""
+    with open(path) as file:
+        data = json.load(file)
+    if "pages" not in data:
+        # A single layout, from before there were pages.
+        return {DEFAULT_PAGE: Layout.from_dict(data)}, DEFAULT_PAGE
+    pages = {name: Layout.from_dict(page) for name, page in data["pages"].items()}
+    return pages, data["shown"]
@@ -1,37 +1,44 @@
-import comm
-import shlex
+import asyncio
+import os
+from actions import Dispatcher, action
+from client import Client
+from deck import Deck
+from discovery import find_port
 
-def main():
-    # ser = comm.Serial(port="/dev/ttyV0")
-    ser = comm.Serial(port="/dev/ttyV0")
-    print("Waiting for handshake...")
-    output = ser.wait_for_connection_stage1()
-    print(output)
-    print("Initial handshake complete")
-    ser.send("ui clean 8 5")
-    ser.send("ui button 0 0 1 1 'Hello world! Howdy!' dispatch nop")
-    ser.send("ui button 0 1 2 2 'This is an x_span\ny_span test...' dispatch nop")
+act = False
 
-    ser.send("ui button 3 0 1 1 'Different bg and text color!' broadcast uuid_here")
-    ser.send("ui bgcolor 3 0 #FF0000")
-    ser.send("ui textcolor 3 0 #FFFFFF")
-    
-    act = False
-    while True:
-        read = ser.read()
-        if read:
-            print(read)
-        
-            if read.startswith("broadcast recieve"):
-                d = shlex.split(read)
-                bm = d[2]
-                if bm == "uuid_here":
-                    if act:
-                        ser.send("ui bgcolor 3 0 #FF0000")
-                    else:
-                        ser.send("ui bgcolor 3 0 #00FF00")
-                    act = not act
+@action("uuid_here")
+def toggle_color(ui, event):
+    global act
+    if act:
+        ui.send("ui bgcolor 3 0 #FF0000")
+    else:
+        ui.send("ui bgcolor 3 0 #00FF00")
+    act = not act
+
+async def main():
+    port = os.environ.get("PIDECK_PORT") or await find_port()
+    if port is None:
+        print("No Pi found on any serial port, set PIDECK_PORT to pick one")
+        return
+    print(f"Waiting for handshake on {port}...")
+    async with Client(port) as client:
+        print("Initial handshake complete")
+        deck = Deck(client)
+        deck.clean(8, 5)
+        deck.button(0, 0, "Hello world! Howdy!")
+        deck.button(0, 1, "This is an x_span\ny_span test...", 2, 2)
+
+        deck.button(3, 0, "Different bg and text color!", broadcast="uuid_here")
+        deck.bgcolor(3, 0, "#FF0000")
+        deck.textcolor(3, 0, "#FFFFFF")
+        print(f"Layout synced with {await deck.sync()} commands")
+
+        dispatcher = Dispatcher(client)
+        try:
+            await dispatcher.run()
+        finally:
+            dispatcher.close()
 
 if __name__ == "__main__":
-    while True:
-        main()
+    asyncio.run(main())
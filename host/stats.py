@@ -0,0 +1,120 @@
+import json
+import math
+import os
+import time
+from bisect import bisect_left
+from collections import OrderedDict
+from contextlib import contextmanager
+
+# Latency histograms, kept by both the host and the Pi. Keep this file
+# identical on both sides.
+
+# Bucket upper bounds in milliseconds; anything slower lands in an overflow
+# bucket. Fixed buckets keep recording O(1) and make dumps comparable.
+BUCKETS_MS = (0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000)
+
+# How many spans (see Stats.begin) may be open at once before the oldest is
+# forgotten, e.g. presses the host never answered.
+MAX_OPEN_SPANS = 64
+
+
+class Histogram:
+    def __init__(self):
+        self.counts = [0] * (len(BUCKETS_MS) + 1)
+        self.count = 0
+        self.total = 0.0
+        self.min = math.inf
+        self.max = 0.0
+
+    def add(self, seconds: float):
+        ms = seconds * 1000
+        self.counts[bisect_left(BUCKETS_MS, ms)] += 1
+        self.count += 1
+        self.total += ms
+        self.min = min(self.min, ms)
+        self.max = max(self.max, ms)
+
+    def percentile(self, p: float) -> float:
+        """Upper bound, in ms, of the bucket holding the p-th percentile."""
+        if not self.count:
+            return 0.0
+        rank = math.ceil(self.count * p / 100)
+        seen = 0
+        for bound, count in zip(BUCKETS_MS, self.counts):
+            seen += count
+            if seen >= rank:
+                return min(bound, self.max)
+        return self.max
+
+    def to_dict(self) -> dict:
+        labels = [f"<={bound}" for bound in BUCKETS_MS] + [f">{BUCKETS_MS[-1]}"]
+        return {
+            "count": self.count,
+            "mean_ms": self.total / self.count if self.count else 0.0,
+            "min_ms": self.min if self.count else 0.0,
+            "max_ms": self.max,
+            "p50_ms": self.percentile(50),
+            "p90_ms": self.percentile(90),
+            "p99_ms": self.percentile(99),
+            "buckets": {
+                label: count for label, count in zip(labels, self.counts) if count
+            },
+        }
+
+
+class Stats:
+    """
+    Named latency histograms. Single durations go through record() or the
+    time() context manager; multi-hop paths like a button press are a span:
+    begin() it, then hop() records the time since begin() at each stage.
+    """
+
+    def __init__(self):
+        self.histograms: dict[str, Histogram] = {}
+        self._spans: OrderedDict[object, float] = OrderedDict()
+
+    def record(self, name: str, seconds: float):
+        histogram = self.histograms.get(name)
+        if histogram is None:
+            histogram = self.histograms[name] = Histogram()
+        histogram.add(seconds)
+
+    @contextmanager
+    def time(self, name: str):
+        start = time.monotonic()
+        try:
+            yield
+        finally:
+            self.record(name, time.monotonic() - start)
+
+    def begin(self, key):
+        self._spans[key] = time.monotonic()
+        if len(self._spans) > MAX_OPEN_SPANS:
+            self._spans.popitem(last=False)
+
+    def hop(self, key, name: str):
+        start = self._spans.get(key)
+        if start is not None:
+            self.record(name, time.monotonic() - start)
+
+    def end(self, key):
+        self._spans.pop(key, None)
+
+    def reset(self):
+        self.histograms.clear()
+
+    def to_dict(self) -> dict:
+        return {name: h.to_dict() for name, h in sorted(self.histograms.items())}
+
+    def dump(self, path: str):
+        """Writes to_dict() to `path` as JSON, atomically."""
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        with open(path + ".tmp", "w") as file:
+            json.dump(self.to_dict(), file, indent=2)
+        os.replace(path + ".tmp", path)
+
+
+# The process-wide instance.
+STATS = Stats()
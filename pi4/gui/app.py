@@ -1,42 +1,291 @@
+from startup import STARTUP
+import itertools
+import os
+import shlex
 import sys
-from PySide6.QtWidgets import QApplication, QVBoxLayout, QWidget
-from PySide6.QtCore import QTimer
+from collections import OrderedDict
+from PySide6.QtWidgets import QApplication, QStackedWidget, QVBoxLayout, QWidget
+from PySide6.QtCore import QEvent, QSocketNotifier, QTimer
+from PySide6.QtGui import QIcon
+STARTUP.mark("import Qt")
 from widgets.scalable_text import ScalableTextWidget
 from widgets.main_grid import MainGridWidget
 import comm
 from comm_updater import comm_updater
+from icon_cache import DEFAULT_DISK_DIR, IconCache
+from assets import AssetStore
+from layout import DEFAULT_PAGE, load_pages, pages_hash, save_pages
+from stats import STATS
+STARTUP.mark("import pideck")
+
+# The last pages the host drew, restored at startup so the deck is usable
+# before the host connects. Written shortly after every committed change.
+SNAPSHOT_PATH = os.path.join(os.path.dirname(DEFAULT_DISK_DIR), "snapshot.json")
+SNAPSHOT_DELAY_MS = 500
+
+# Pages are kept as prebuilt grids so switching needs no serial traffic. Past
+# this many, the least recently used page is dropped and the host told so.
+MAX_PAGES = 8
+
+WINDOW_TITLE = "Pideck Raspberry Pi Client"
 
 
 class SimpleWindow(QWidget):
+    """
+    The deck's window. Only what the first frame needs is built here; the
+    serial link, icon cache and snapshot follow in start(), which runs once
+    that frame has been painted.
+    """
+
     def __init__(self):
         super().__init__()
         self.timer = QTimer()
+        self.started = False
 
-        self.comm_port = comm.Serial(port="/dev/ttyV1")
+        # Button presses are numbered so the host's answer can be timed.
+        self.press_ids = itertools.count(1)
+        # Presses whose answer has been applied but not painted yet.
+        self.repaint_marks: list[int] = []
 
-        self.setWindowTitle("Pideck Raspberry Pi Client")
+        self.setWindowTitle(WINDOW_TITLE)
         layout = QVBoxLayout()
 
         self.loading_widget = ScalableTextWidget("Initial Loading\nWaiting for host...")
         layout.addWidget(self.loading_widget)
 
-        self.main_grid = MainGridWidget(1, 1)
-        layout.addWidget(self.main_grid)
-        self.main_grid.hide()
-        
+        self.pages = QStackedWidget()
+        layout.addWidget(self.pages)
+        self.pages.hide()
+        self.grids: OrderedDict[str, MainGridWidget] = OrderedDict()
+        self.shown_page = DEFAULT_PAGE
+        # The page between "ui page begin" and "ui page end", if any.
+        self.edit_page: str | None = None
+        self.page_history: list[str] = []
+        self.pages.setCurrentWidget(self._get_page(DEFAULT_PAGE))
+        self.setLayout(layout)
+
+        self._snapshot_hash: tuple[str, str] | None = None
+        self.snapshot_timer = QTimer()
+        self.snapshot_timer.setSingleShot(True)
+        self.snapshot_timer.timeout.connect(self.save_snapshot)
+
+    def start(self):
+        self.comm_port = comm.Serial(port=os.environ.get("PIDECK_PORT", "/dev/ttyV1"))
+        self.comm_port.capabilities = lambda: [
+            f"page={self.shown_page}",
+            f"state={pages_hash(self.page_states())}",
+        ]
+        STARTUP.mark("serial")
+
+        self.icon_cache = IconCache(disk_dir=DEFAULT_DISK_DIR)
+        self.icon_cache.icon_ready.connect(self.on_icon_ready)
+        self.icon_cache.icon_missing.connect(self.on_icon_missing)
+        self.assets = AssetStore()
+        STARTUP.mark("icon cache")
+
+        # Incoming bytes are handled as soon as the serial fd becomes readable.
+        # The timer only drives the handshake, which needs the Pi to keep
+        # announcing itself while the link is still silent.
+        self.comm_notifier = QSocketNotifier(
+            self.comm_port.ser.fileno(), QSocketNotifier.Type.Read, self
+        )
+        self.comm_notifier.activated.connect(self.look_into_serial_comm)
+
         self.timer.timeout.connect(self.look_into_serial_comm)
         self.timer.start(100)
 
-        self.setLayout(layout)
+        # The host reconnects by itself when the link drops; the Pi only
+        # pings it and shows whether it is there.
+        self.host_online = False
+        self.heartbeat_timer = QTimer()
+        self.heartbeat_timer.timeout.connect(self.on_heartbeat)
+        self.heartbeat_timer.start(int(self.comm_port.heartbeat.interval * 1000))
+
+        self.restore_snapshot()
+        STARTUP.mark("snapshot")
+        if os.environ.get("PIDECK_STARTUP_REPORT"):
+            print(STARTUP.report())
+
+    @property
+    def main_grid(self) -> MainGridWidget:
+        """The grid ui commands apply to: the page being built, else the shown one."""
+        return self.grids[self.edit_page or self.shown_page]
+
+    def page_states(self):
+        return {name: grid.state for name, grid in self.grids.items()}
+
+    def _get_page(self, name: str) -> MainGridWidget:
+        """Returns page `name`, creating it (and evicting another) if needed."""
+        grid = self.grids.get(name)
+        if grid is not None:
+            self.grids.move_to_end(name)
+            return grid
+
+        grid = MainGridWidget(1, 1)
+        self.grids[name] = grid
+        self.pages.addWidget(grid)
+
+        for old_name in list(self.grids):
+            if len(self.grids) <= MAX_PAGES:
+                break
+            if old_name in (name, self.shown_page, self.edit_page):
+                continue
+            old_grid = self.grids.pop(old_name)
+            self.pages.removeWidget(old_grid)
+            old_grid.deleteLater()
+            self.comm_port.send(f"page evicted {old_name}")
+        return grid
+
+    def begin_page(self, name: str):
+        self._get_page(name)
+        self.edit_page = name
+
+    def end_page(self):
+        self.edit_page = None
+
+    def show_page(self, name: str) -> bool:
+        """
+        Switches to page `name` in a single frame. Returns False, and asks the
+        host for the page, if it isn't here (any more).
+        """
+        if name not in self.grids:
+            self.comm_port.send(f"page miss {name}")
+            return False
+        if name != self.shown_page:
+            self.page_history.append(self.shown_page)
+            del self.page_history[:-MAX_PAGES]
+        self.shown_page = name
+        self.pages.setCurrentWidget(self._get_page(name))
+        self.reveal_pages()
+        self.comm_port.send(f"page shown {name}")
+        self.snapshot_timer.start(SNAPSHOT_DELAY_MS)
+        return True
+
+    def back_page(self) -> bool:
+        """Goes back to the page shown before the current one."""
+        while self.page_history:
+            name = self.page_history.pop()
+            # Pages that were evicted are skipped, and so is the shown one,
+            # which the history holds again once the page between went.
+            if name in self.grids and name != self.shown_page:
+                self.show_page(name)
+                # show_page() recorded the page we are leaving; drop it.
+                self.page_history.pop()
+                return True
+        return False
+
+    def reveal_pages(self):
+        """Swaps the loading screen for the pages once there is something to show."""
+        if self.grids[self.shown_page].state.size is None:
+            return
+        self.loading_widget.hide()
+        self.pages.show()
+
+    def restore_snapshot(self):
+        try:
+            pages, shown = load_pages(SNAPSHOT_PATH)
+        except FileNotFoundError:
+            return
+        except (OSError, ValueError, KeyError) as e:
+            print(f"[WARN] Could not read layout snapshot: {e}")
+            return
+
+        # Replayed through the same parsers and handlers as the host's commands.
+        lines = []
+        for name, snapshot in pages.items():
+            # Icons that aren't cached any more are left out, so the state
+            # hash tells the host to send them again.
+            for cell in snapshot.cells.values():
+                if "icon" in cell and not self.icon_cache.has(cell["icon"]):
+                    del cell["icon"]
+            lines += [f"ui page begin {name}", *snapshot.commands(), "ui page end"]
+        lines.append(f"ui page show {shown}")
+
+        try:
+            updates = []
+            for line in lines:
+                args = shlex.split(line)
+                updates.append(comm.find_parser(args)(args))
+        except (IndexError, ValueError, TypeError, NotImplementedError) as e:
+            print(f"[WARN] Could not restore layout snapshot: {e}")
+            return
+        if any(comm_updater.update_comm(self, updates)):
+            print("[WARN] Parts of the layout snapshot could not be restored")
+        self._snapshot_hash = (pages_hash(self.page_states()), self.shown_page)
+
+    def save_snapshot(self):
+        # An open batch is saved once it is committed.
+        if any(grid.is_batch_open for grid in self.grids.values()):
+            return
+        states = self.page_states()
+        snapshot_hash = (pages_hash(states), self.shown_page)
+        if snapshot_hash == self._snapshot_hash:
+            return
+        try:
+            save_pages(SNAPSHOT_PATH, states, self.shown_page)
+        except OSError as e:
+            print(f"[WARN] Could not write layout snapshot: {e}")
+            return
+        self._snapshot_hash = snapshot_hash
+
+    def event(self, event: QEvent) -> bool:
+        handled = super().event(event)
+        if event.type() == QEvent.Type.Paint and not self.started:
+            self.started = True
+            STARTUP.mark("first frame")
+            # Once the frame is on screen.
+            QTimer.singleShot(0, self.start)
+        if event.type() == QEvent.Type.UpdateRequest and self.repaint_marks:
+            # Every pending change in the window has been painted by now.
+            for press in self.repaint_marks:
+                STATS.hop(("press", press), "press -> repaint")
+                STATS.end(("press", press))
+            self.repaint_marks.clear()
+        return handled
+
+    def on_heartbeat(self):
+        online = self.comm_port.beat()
+        self.update_timer()
+        if online == self.host_online:
+            return
+        self.host_online = online
+        if online:
+            self.setWindowTitle(WINDOW_TITLE)
+        else:
+            print("[WARN] Lost the link to the host")
+            self.setWindowTitle(f"{WINDOW_TITLE} (host offline)")
+
+    def on_icon_ready(self, key: str, icon: QIcon):
+        for grid in self.grids.values():
+            grid.apply_icon(key, icon)
+
+    def on_icon_missing(self, key: str):
+        # Ask the host for the bytes; they come back as an icon_put.
+        self.comm_port.send(f"icon miss {key}")
 
     def look_into_serial_comm(self):
         data_received = self.comm_port.tick()
-        comm_updater.update_comm(self, data_received)
+        results = comm_updater.update_comm(self, data_received)
+        # Only acknowledged now, so an ack means the command took effect.
+        self.comm_port.answer(data_received, results)
+        if data_received and self.comm_port.handshake_complete_stage[1]:
+            self.snapshot_timer.start(SNAPSHOT_DELAY_MS)
+        self.update_timer()
+
+    def update_timer(self):
+        if self.comm_port.handshake_complete_stage[1]:
+            if self.timer.isActive():
+                self.timer.stop()
+        elif not self.timer.isActive():
+            # The handshake was restarted.
+            self.timer.start(100)
 
 
 if __name__ == "__main__":
     app = QApplication(sys.argv)
+    STARTUP.mark("QApplication")
     window = SimpleWindow()
+    STARTUP.mark("window")
     window.show()
     # window.showFullScreen()
     window.resize(1024, 600)
@@ -0,0 +1,81 @@
+import hashlib
+import re
+
+# Icons and assets are addressed by "sha256:<hex digest of their bytes>". Keys
+# from the host are checked against this before they go anywhere near a path.
+CONTENT_KEY = re.compile(r"sha256:[0-9a-f]{64}")
+
+# Refuse transfers that would make the Pi preallocate more than this.
+MAX_ASSET_SIZE = 16 * 1024 * 1024
+
+
+class AssetTransfer:
+    """
+    One chunked upload. The whole buffer is allocated up front and chunks are
+    copied into place as they arrive, in any order.
+    """
+
+    def __init__(self, key: str, size: int, chunk_size: int):
+        if size > MAX_ASSET_SIZE:
+            raise ValueError(f"Asset of {size} bytes exceeds {MAX_ASSET_SIZE}")
+        if chunk_size <= 0:
+            raise ValueError("Chunk size must be positive")
+
+        self.key = key
+        self.size = size
+        self.chunk_size = chunk_size
+        self.chunk_count = max(1, -(-size // chunk_size))
+        self.buffer = bytearray(size)
+        self.received = bytearray(self.chunk_count)
+
+    def write_chunk(self, index: int, data: bytes):
+        if not 0 <= index < self.chunk_count:
+            raise ValueError(f"Chunk {index} is out of range")
+        start = index * self.chunk_size
+        expected = min(self.chunk_size, self.size - start)
+        if len(data) != expected:
+            raise ValueError(f"Chunk {index} is {len(data)} bytes, expected {expected}")
+        self.buffer[start : start + expected] = data
+        self.received[index] = 1
+
+    def first_missing(self) -> int:
+        """Index of the first chunk not received yet, or chunk_count if none."""
+        index = self.received.find(0)
+        return self.chunk_count if index == -1 else index
+
+    def verify(self) -> bool:
+        if self.first_missing() != self.chunk_count:
+            return False
+        return "sha256:" + hashlib.sha256(self.buffer).hexdigest() == self.key
+
+
+class AssetStore:
+    """Transfers in progress, keyed by the content hash of the asset."""
+
+    def __init__(self):
+        self.transfers: dict[str, AssetTransfer] = {}
+
+    def begin(self, key: str, size: int, chunk_size: int) -> AssetTransfer:
+        """
+        Starts a transfer, or resumes the existing one for `key` if it has the
+        same size and chunk size (e.g. after the link dropped midway).
+        """
+        transfer = self.transfers.get(key)
+        if (
+            transfer is None
+            or transfer.size != size
+            or transfer.chunk_size != chunk_size
+        ):
+            transfer = AssetTransfer(key, size, chunk_size)
+            self.transfers[key] = transfer
+        return transfer
+
+    def finish(self, key: str) -> bytes | None:
+        """
+        Ends the transfer for `key`. Returns the data if it is complete and
+        matches its hash, otherwise None.
+        """
+        transfer = self.transfers.pop(key, None)
+        if transfer is None or not transfer.verify():
+            return None
+        return bytes(transfer.buffer)
@@ -1,7 +1,21 @@
 import serial
 import time
-from typing import TypedDict, Literal
+from collections import OrderedDict, deque
+from typing import Callable, TypedDict, Literal
+import base64
 import shlex
+import struct
+import framing
+from heartbeat import Heartbeat
+from assets import CONTENT_KEY
+from layout import PAGE_NAME, REGIONS, Cell, parse_region
+from stats import STATS
+
+
+def content_key(token: str) -> str:
+    if not CONTENT_KEY.fullmatch(token):
+        raise ValueError(f"Invalid content hash {token!r}")
+    return token
 
 
 def shplit(raw_data: str):
@@ -36,7 +50,88 @@ class UIIconParseOutput(TypedDict):
     type: Literal["ui_icon"]
     x: int
     y: int
-    base64icon: str
+    icon: bytes
+
+
+class UIIconRefParseOutput(TypedDict):
+    type: Literal["ui_icon_ref"]
+    x: int
+    y: int
+    hash: str
+
+
+class UITextParseOutput(TypedDict):
+    type: Literal["ui_text"]
+    x: int
+    y: int
+    text: str
+
+
+class UIRegionParseOutput(TypedDict):
+    type: Literal["ui_region"]
+    field: Literal["bgcolor", "textcolor", "icon", "text"]
+    # None for every cell of the grid.
+    cells: list[Cell] | None
+    value: str
+
+
+class IconPutParseOutput(TypedDict):
+    type: Literal["icon_put"]
+    hash: str
+    icon: bytes
+
+
+class AssetBeginParseOutput(TypedDict):
+    type: Literal["asset_begin"]
+    hash: str
+    size: int
+    chunk_size: int
+
+
+class AssetChunkParseOutput(TypedDict):
+    type: Literal["asset_chunk"]
+    hash: str
+    index: int
+    data: bytes
+
+
+class AssetEndParseOutput(TypedDict):
+    type: Literal["asset_end"]
+    hash: str
+
+
+class UIBatchParseOutput(TypedDict):
+    type: Literal["ui_batch"]
+    action: Literal["begin", "commit"]
+
+
+class UIResetParseOutput(TypedDict):
+    type: Literal["ui_reset"]
+    x: int
+    y: int
+
+
+class UIPageParseOutput(TypedDict):
+    type: Literal["ui_page"]
+    action: Literal["begin", "end", "show"]
+    name: str | None
+
+
+class StatsParseOutput(TypedDict):
+    type: Literal["stats"]
+    reset: bool
+
+
+class PressDoneParseOutput(TypedDict):
+    type: Literal["press_done"]
+    press: int
+    host_seconds: float
+
+
+class DebugPressParseOutput(TypedDict):
+    type: Literal["debug_press"]
+    x: int
+    y: int
 
 
 class UICleanParseOutput(TypedDict):
@@ -45,15 +140,296 @@ class UICleanParseOutput(TypedDict):
     height: int
 
 
+CommandParser = Callable[[list[str]], dict]
+
+# Maps a command verb ("ui button", "ping", ...) to the function that turns its
+# tokens into an update dict. Populated with the @command decorator.
+COMMANDS: dict[str, CommandParser] = {}
+
+
+def command(*verbs: str):
+    """
+    Registers the decorated function as the parser for each of `verbs`.
+    A verb is either the first token of a line or the first two tokens joined
+    by a space, e.g. "ui button".
+    """
+
+    def decorator(func: CommandParser):
+        for verb in verbs:
+            COMMANDS[verb] = func
+        return func
+
+    return decorator
+
+
+def find_parser(args: list[str]) -> CommandParser | None:
+    """Looks up the parser for a tokenized line by its verb."""
+    return COMMANDS.get(" ".join(args[:2])) or COMMANDS.get(args[0])
+
+
+BinaryCommandParser = Callable[[bytes], dict]
+
+# Same as COMMANDS, but for binary frame types that carry their own payload
+# layout instead of a command line.
+BINARY_COMMANDS: dict[int, BinaryCommandParser] = {}
+
+
+def binary_command(*frame_types: int):
+    """Registers the decorated function as the parser for each of `frame_types`."""
+
+    def decorator(func: BinaryCommandParser):
+        for frame_type in frame_types:
+            BINARY_COMMANDS[frame_type] = func
+        return func
+
+    return decorator
+
+
+@command("ui button")
+def ui_button_parse(args: list[str]):
+    x = int(args[2])
+    y = int(args[3])
+
+    x_span = int(args[4])
+    y_span = int(args[5])
+
+    text = args[6]
+
+    broadcast = True if args[7] == "broadcast" else False
+    message = args[8]
+
+    return UIButtonParseOutput(
+        type="ui_button",
+        x=x,
+        y=y,
+        x_span=x_span,
+        y_span=y_span,
+        text=text,
+        broadcast=broadcast,
+        message=message,
+    )
+
+
+@command("ui bgcolor", "ui textcolor")
+def ui_color_parse(args: list[str]):
+    if args[2] in REGIONS:
+        return ui_region_parse(args)
+
+    x = int(args[2])
+    y = int(args[3])
+
+    color = args[4]
+
+    return UIColorParseOutput(type=f"ui_{args[1]}", x=x, y=y, color=color)
+
+
+@command("ui icon")
+def ui_icon_parse(args: list[str]):
+    if args[2] in REGIONS:
+        # Icons for a region must be sent by hash.
+        content_key(args[-1])
+        return ui_region_parse(args)
+
+    x = int(args[2])
+    y = int(args[3])
+
+    if args[4].startswith("sha256:"):
+        # Icon by content hash; the bytes are only uploaded on a cache miss.
+        return UIIconRefParseOutput(type="ui_icon_ref", x=x, y=y, hash=content_key(args[4]))
+
+    icon = base64.b64decode(args[4])
+    return UIIconParseOutput(type="ui_icon", x=x, y=y, icon=icon)
+
+
+@command("ui text")
+def ui_text_parse(args: list[str]):
+    if args[2] in REGIONS:
+        return ui_region_parse(args)
+
+    x = int(args[2])
+    y = int(args[3])
+    return UITextParseOutput(type="ui_text", x=x, y=y, text=args[4])
+
+
+def ui_region_parse(args: list[str]):
+    """Parses "ui <field> <region> <value>", see layout.REGIONS."""
+    if len(args) < 4:
+        raise IndexError("Missing region value")
+    return UIRegionParseOutput(
+        type="ui_region",
+        field=args[1],
+        cells=parse_region(args[2:-1]),
+        value=args[-1],
+    )
+
+
+@binary_command(framing.FRAME_ICON)
+def ui_icon_frame_parse(payload: bytes):
+    x, y = framing.ICON_HEADER.unpack_from(payload)
+    icon = payload[framing.ICON_HEADER.size :]
+    return UIIconParseOutput(type="ui_icon", x=x, y=y, icon=icon)
+
+
+@command("icon put")
+def icon_put_parse(args: list[str]):
+    return IconPutParseOutput(
+        type="icon_put", hash=content_key(args[2]), icon=base64.b64decode(args[3])
+    )
+
+
+@binary_command(framing.FRAME_ICON_PUT)
+def icon_put_frame_parse(payload: bytes):
+    digest = payload[: framing.ICON_DIGEST_SIZE]
+    if len(digest) != framing.ICON_DIGEST_SIZE:
+        raise ValueError("Icon digest is truncated")
+    return IconPutParseOutput(
+        type="icon_put",
+        hash="sha256:" + digest.hex(),
+        icon=payload[framing.ICON_DIGEST_SIZE :],
+    )
+
+
+@command("asset begin")
+def asset_begin_parse(args: list[str]):
+    return AssetBeginParseOutput(
+        type="asset_begin",
+        hash=content_key(args[2]),
+        size=int(args[3]),
+        chunk_size=int(args[4]),
+    )
+
+
+@command("asset chunk")
+def asset_chunk_parse(args: list[str]):
+    return AssetChunkParseOutput(
+        type="asset_chunk",
+        hash=content_key(args[2]),
+        index=int(args[3]),
+        data=base64.b64decode(args[4]),
+    )
+
+
+@binary_command(framing.FRAME_ASSET_CHUNK)
+def asset_chunk_frame_parse(payload: bytes):
+    digest, index = framing.ASSET_CHUNK_HEADER.unpack_from(payload)
+    return AssetChunkParseOutput(
+        type="asset_chunk",
+        hash="sha256:" + digest.hex(),
+        index=index,
+        data=payload[framing.ASSET_CHUNK_HEADER.size :],
+    )
+
+
+@command("asset end")
+def asset_end_parse(args: list[str]):
+    return AssetEndParseOutput(type="asset_end", hash=content_key(args[2]))
+
+
+@command("ui batch")
+def ui_batch_parse(args: list[str]):
+    action = args[2]
+    if action not in ["begin", "commit"]:
+        raise ValueError(f"Unknown batch action {action!r}")
+
+    return UIBatchParseOutput(type="ui_batch", action=action)
+
+
+@command("ui clean")
+def ui_clean_parse(args: list[str]):
+    width = int(args[2])
+    height = int(args[3])
+
+    try:
+        theme = args[4]
+    except IndexError:
+        theme = None
+
+    if theme is not None:
+        raise NotImplementedError
+
+    return UICleanParseOutput(type="ui_clean", width=width, height=height)
+
+
+@command("ui page")
+def ui_page_parse(args: list[str]):
+    action = args[2]
+    if action not in ("begin", "end", "show"):
+        raise ValueError(f"Unknown page action {action!r}")
+
+    name = None
+    if action != "end":
+        name = args[3]
+        if not PAGE_NAME.fullmatch(name):
+            raise ValueError(f"Invalid page name {name!r}")
+
+    return UIPageParseOutput(type="ui_page", action=action, name=name)
+
+
+@command("ui reset")
+def ui_reset_parse(args: list[str]):
+    return UIResetParseOutput(type="ui_reset", x=int(args[2]), y=int(args[3]))
+
+
+@command("stats")
+def stats_parse(args: list[str]):
+    return StatsParseOutput(type="stats", reset=args[1:2] == ["reset"])
+
+
+@command("press done")
+def press_done_parse(args: list[str]):
+    return PressDoneParseOutput(
+        type="press_done", press=int(args[2]), host_seconds=float(args[3])
+    )
+
+
+@command("debug press")
+def debug_press_parse(args: list[str]):
+    return DebugPressParseOutput(type="debug_press", x=int(args[2]), y=int(args[3]))
+
+
+# Upper bound on a single unterminated frame. Anything longer is dropped up to
+# the next newline so a garbled link can't grow the receive buffer forever.
+MAX_BUFFER_SIZE = 1024 * 1024
+
+# How many recently acknowledged sequence numbers are remembered, so a command
+# the host retransmits after a lost ack is acknowledged again but not re-applied.
+RECENT_SEQS = 256
+
+# Sequence numbers run from 1 to SEQ_MAX and wrap around; 0 means "unsequenced".
+SEQ_MAX = 0xFFFF
+
+
 class Serial:
     def __init__(
         self,
         port="/dev/ttyS0",
-        baudrate=115200,
+        baudrate=framing.BASE_BAUDRATE,
         timeout=1,
         verbose: bool | None = None,
+        baudrates: tuple[int, ...] = framing.BAUDRATES,
     ):
         self.handshake_complete_stage = {1: False}
+        # Returns extra "key=value" tokens for the handshake, e.g. the hash of
+        # what the Pi shows, so the host can send only what changed.
+        self.capabilities: Callable[[], list[str]] | None = None
+
+        # Switched on during the stage 1 handshake if the host asks for it.
+        self.binary = False
+        self.compress = False
+        # Offered to the host, which may move the link to one of them.
+        self.base_baudrate = baudrate
+        self.baudrates = baudrates
+
+        self._rx_buffer = bytearray()
+        self._rx_discarding = False
+        self._rx_lines: deque[bytes] = deque()
+        self._rx_frames: deque[framing.Frame] = deque()
+        self._frame_decoder = framing.FrameDecoder()
+        self._recent_acks: OrderedDict[int, str] = OrderedDict()
+        # Sequenced commands are applied strictly in order: this is the one
+        # that must come next, as announced by the host in the handshake.
+        self._next_seq: int | None = None
+        self.heartbeat = Heartbeat()
 
         self.ser = serial.Serial(
             port=port,
@@ -68,17 +444,165 @@ class Serial:
         if self.verbose:
             print("[INFO] Serial port opened successfully")
 
+    def _receive(self):
+        """
+        Drains the serial port. In text mode, every complete line is queued in
+        _rx_lines and a trailing partial line stays in the receive buffer until
+        the rest of it arrives. In binary mode, complete frames are queued in
+        _rx_frames.
+        """
+        if self.ser.in_waiting <= 0:
+            return
+        data = self.ser.read(self.ser.in_waiting)
+
+        if self.binary:
+            frames = self._frame_decoder.feed(data)
+            if frames:
+                # Bytes alone could be a restarted host's plain text.
+                self.heartbeat.heard()
+            self._rx_frames.extend(frames)
+            return
+
+        self._rx_buffer += data
+        end = self._rx_buffer.rfind(b"\n")
+        if end == -1:
+            if len(self._rx_buffer) > MAX_BUFFER_SIZE:
+                if self.verbose:
+                    print("[WARN] Receive buffer overflow, dropping partial frame")
+                self._rx_buffer.clear()
+                self._rx_discarding = True
+            return
+
+        lines = bytes(self._rx_buffer[:end]).split(b"\n")
+        del self._rx_buffer[: end + 1]
+        self.heartbeat.heard()
+
+        if self._rx_discarding:
+            # The first line is the tail of a frame we already dropped.
+            lines.pop(0)
+            self._rx_discarding = False
+
+        self._rx_lines.extend(lines)
+
+    def _pop_line(self) -> str | None:
+        if self._rx_lines:
+            return self._rx_lines.popleft().decode("utf-8", errors="replace")
+
+    def _enter_binary_mode(self):
+        # Whatever arrived after the handshake line is already binary.
+        leftover = b"".join(line + b"\n" for line in self._rx_lines)
+        leftover += self._rx_buffer
+        self._rx_lines.clear()
+        self._rx_buffer.clear()
+        self._rx_discarding = False
+
+        self.binary = True
+        self._rx_frames.extend(self._frame_decoder.feed(leftover))
+
+        if self.verbose:
+            print("[INFO] Switched to binary framing")
+
+    def _restart_handshake(self):
+        """The host (re)connected and wants a fresh handshake."""
+        self.handshake_complete_stage[1] = False
+        self.binary = False
+        self.compress = False
+        self._set_baudrate(self.base_baudrate)
+        self._frame_decoder = framing.FrameDecoder()
+        self._rx_frames.clear()
+        self._next_seq = None
+        if self.verbose:
+            print("[INFO] Host requested a new handshake")
+
+    def _set_baudrate(self, baudrate: int):
+        if self.ser.baudrate == baudrate:
+            return
+        # Whatever was written so far goes out at the old rate.
+        self.ser.flush()
+        self.ser.baudrate = baudrate
+        self.heartbeat.reset()
+        if self.verbose:
+            print(f"[INFO] Link running at {baudrate} baud")
+
     def read(self):
-        if self.ser.in_waiting > 0:
-            data = (
-                self.ser.read(self.ser.in_waiting).decode("utf-8").rstrip()
-            )  # Read a line, decode, remove trailing newline
-            # print(data)
-            return data
-
-    def send(self, data: str, end=""):
+        self._receive()
+        lines = []
+        while (line := self._pop_line()) is not None:
+            lines.append(line)
+        if lines:
+            return "\n".join(lines)
+
+    def send(self, data: str, end="\n"):
+        if self.binary:
+            payload = (data + end).encode("utf-8")
+            self.ser.write(framing.encode_frame(framing.FRAME_TEXT, payload, 0, self.compress))
+            return
         self.ser.write((data + end).encode("utf-8"))
 
+    def _reply(self, seq: int, reply: str):
+        if seq:
+            self._recent_acks[seq] = reply
+            if len(self._recent_acks) > RECENT_SEQS:
+                self._recent_acks.popitem(last=False)
+        self.send(reply)
+
+    def ack(self, seq: int):
+        self._reply(seq, f"ok {seq}")
+
+    def reject(self, reason: str, line: str, seq: int = 0):
+        """Single error path for every line the Pi could not turn into an update."""
+        if self.verbose:
+            print(f"[WARN] Rejected ({reason}): {line!r}")
+        self._reply(seq, shlex.join(["error", str(seq), reason]))
+
+    def answer(self, updates: list[dict], results: list[str | None]):
+        """
+        Acknowledges the commands behind `updates` once update_comm() has
+        applied them, or rejects the ones it couldn't with its reason.
+        """
+        for update, error in zip(updates, results):
+            if "seq" not in update:
+                continue
+            if error is None:
+                self.ack(update["seq"])
+            else:
+                self.reject(error, update["type"], update["seq"])
+
+    def _in_order(self, seq: int) -> bool:
+        """
+        Returns whether a sequenced command is the next one due. A command
+        that was already answered gets its reply again. One that comes after
+        a lost command is dropped: the host sends it again, in order, after
+        it has resent the lost one.
+        """
+        if not seq:
+            return True
+        reply = self._recent_acks.get(seq)
+        if reply is not None:
+            self.send(reply)
+            return False
+        if self._next_seq is not None and seq != self._next_seq:
+            if self.verbose and (seq - self._next_seq) % SEQ_MAX < SEQ_MAX // 2:
+                print(f"[WARN] Dropped command {seq}, waiting for {self._next_seq}")
+            return False
+        self._next_seq = seq % SEQ_MAX + 1
+        return True
+
+    def beat(self) -> bool:
+        """
+        Pings the host, to be called every heartbeat interval. Returns whether
+        the host has been heard from recently.
+        """
+        if self.ser.baudrate != self.base_baudrate and not self.heartbeat.alive():
+            # Maybe the faster rate doesn't work on this cable after all; the
+            # host falls back as well.
+            print(f"[WARN] Nothing valid at {self.ser.baudrate} baud, falling back")
+            self._restart_handshake()
+        if not self.handshake_complete_stage[1]:
+            return False
+        self.send(f"ping {self.heartbeat.ping()}")
+        return self.heartbeat.alive()
+
     def wait_for_connection_stage1(
         self, iterations: int | None = None, delay=1, data: str | None = None
     ):
@@ -90,107 +614,155 @@ class Serial:
         while (iterations is None) or (iters_done <= iterations):
             if data is None:
                 data = self.read()
-            self.send("handshake stage1 init")
+            # Advertise the optional capabilities the host may opt into.
+            init = [
+                "handshake",
+                "stage1",
+                "init",
+                "binary",
+                "zlib",
+                "baud=" + ",".join(str(rate) for rate in self.baudrates),
+            ]
+            if self.capabilities is not None:
+                init += self.capabilities()
+            self.send(" ".join(init))
             if "handshake stage1 complete" in str(data):
                 print("Stage 1 Handshake Complete: Host is now online.")
                 self.handshake_complete_stage[1] = True
+                self._recent_acks.clear()
+                self._next_seq = None
+                self.heartbeat.reset()
+                options = str(data).split()
+                if "binary" in options:
+                    self._enter_binary_mode()
+                    self.compress = "zlib" in options
+                for option in options:
+                    if option.startswith("baud=") and option[5:].isdigit():
+                        # The host checks the new rate with "handshake stage1 verify".
+                        self._set_baudrate(int(option[5:]))
+                    if option.startswith("seq=") and option[4:].isdigit():
+                        self._next_seq = int(option[4:])
                 return True
             time.sleep(delay)
             iters_done += 1
         return False
 
-    def ui_button_parse(self, data: str):
-        args = shplit(data)
-        if args[0] != "ui":
+    def _dispatch_args(
+        self, args: list[str], line: str, returnData: list, seq: int, start: float
+    ):
+        """`start` is when tokenizing `line` began, for the "parse" timing."""
+        if not args:
             return
-
-        if args[1] != "button":
+        if args[0] in ("ping", "pong") and len(args) == 2:
+            # Part of the link rather than the UI, so answered right here.
+            if args[0] == "ping":
+                self.send(f"pong {args[1]}")
+            else:
+                self.heartbeat.pong(args[1])
+            if seq:
+                self.ack(seq)
+            return
+        if args[0] == "seq" and len(args) == 2 and args[1].isdigit():
+            # The host gave up on a command; carry on from the next one.
+            self._next_seq = int(args[1])
             return
 
-        x = int(args[2])
-        y = int(args[3])
-
-        x_span = int(args[4])
-        y_span = int(args[5])
-
-        text = args[6]
-
-        broadcast = True if args[7] == "broadcast" else False
-        message = args[8]
-
-        return UIButtonParseOutput(
-            type="ui_button",
-            x=x,
-            y=y,
-            x_span=x_span,
-            y_span=y_span,
-            text=text,
-            broadcast=broadcast,
-            message=message,
-        )
-
-    def ui_color_parse(self, data: str):
-        args = shplit(data)
-
-        if args[0] != "ui":
+        parser = find_parser(args)
+        if parser is None:
+            self.reject("unknown", line, seq)
             return
 
-        if args[1] not in ["bgcolor", "textcolor"]:
+        try:
+            parsed = parser(args)
+        except (IndexError, ValueError, NotImplementedError):
+            self.reject("invalid", line, seq)
             return
+        STATS.record(f"parse {parsed['type']}", time.monotonic() - start)
 
-        x = int(args[2])
-        y = int(args[3])
+        # Acknowledged by answer() once it has been applied.
+        parsed["seq"] = seq
+        returnData.append(parsed)
 
-        color = args[4]
+    def _dispatch_line(self, line: str, returnData: list):
+        line = line.strip()
+        if line == "handshake stage1 restart":
+            self._restart_handshake()
+            return
+        if line == "handshake stage1 verify":
+            self.send("handshake stage1 verified")
+            return
+        if line.startswith("handshake "):
+            return
 
-        return UIColorParseOutput(type=f"ui_{args[1]}", x=x, y=y, color=color)
+        # Sequenced commands look like "@<seq> <command>".
+        seq = 0
+        if line.startswith("@"):
+            seq_token, _, line = line.partition(" ")
+            try:
+                seq = int(seq_token[1:])
+            except ValueError:
+                self.reject("unparsable", line)
+                return
+            if not self._in_order(seq):
+                return
+
+        # Tokenize once; the parser works on the same argument list.
+        start = time.monotonic()
+        try:
+            args = shplit(line)
+        except ValueError:
+            self.reject("unparsable", line, seq)
+            return
 
-    def ui_icon_parse(self, data: str):
-        args = shplit(data)
+        self._dispatch_args(args, line, returnData, seq, start)
 
-        if args[0] != "ui":
+    def _dispatch_frame(self, frame: framing.Frame, returnData: list):
+        if not self._in_order(frame.seq):
             return
 
-        if args[1] != "icon":
+        start = time.monotonic()
+        if frame.type == framing.FRAME_TEXT:
+            line = frame.payload.decode("utf-8", errors="replace")
+            if line.strip() == "handshake stage1 restart":
+                self._restart_handshake()
+                return
+            if line.strip() == "handshake stage1 verify":
+                self.send("handshake stage1 verified")
+                return
+            # Frames are length-delimited, so the text needs no unescaping.
+            try:
+                args = shlex.split(line)
+            except ValueError:
+                self.reject("unparsable", line, frame.seq)
+                return
+            self._dispatch_args(args, line, returnData, frame.seq, start)
             return
 
-        x = int(args[2])
-        y = int(args[3])
-
-        base64icon = args[4]
-        return UIIconParseOutput(type="ui_icon", x=x, y=y, base64icon=base64icon)
-
-    def ui_clean_parse(self, data: str):
-        args = shplit(data)
-        if args[0] != "ui" or args[1] != "clean":
+        parser = BINARY_COMMANDS.get(frame.type)
+        if parser is None:
+            self.reject("unknown", f"frame type {frame.type}", frame.seq)
             return
-        width = int(args[2])
-        height = int(args[3])
 
         try:
-            theme = args[4]
-        except IndexError:
-            theme = None
-
-        if theme is not None:
-            raise NotImplementedError
+            parsed = parser(frame.payload)
+        except (IndexError, ValueError, struct.error):
+            self.reject("invalid", f"frame type {frame.type}", frame.seq)
+            return
+        STATS.record(f"parse {parsed['type']}", time.monotonic() - start)
 
-        return UICleanParseOutput(type="ui_clean", width=width, height=height)
+        parsed["seq"] = frame.seq
+        returnData.append(parsed)
 
     def tick(self):
-        data = self.read()
-        if data is not None:
-            datalines = data.splitlines()
-        else:
-            datalines = ["NOP"]
+        self._receive()
 
         returnData = []
 
-        for line in datalines:
-            if line:
-                line = line.strip()
-            if not self.handshake_complete_stage[1]:
-                if self.wait_for_connection_stage1(iterations=1, delay=0, data=line):
+        if not self.handshake_complete_stage[1]:
+            line = self._pop_line()
+            while True:
+                data = "NOP" if line is None else line.strip()
+                if self.wait_for_connection_stage1(iterations=1, delay=0, data=data):
                     returnData.append(
                         TickLoadingOutput(
                             {
@@ -209,28 +781,18 @@ class Serial:
                         )
                     )
 
-            if line.startswith("ui clean"):
-                parsed = self.ui_clean_parse(line)
-                if parsed is not None:
-                    self.send("ok")
-                    returnData.append(parsed)
-
-            if line.startswith("ui button"):
-                parsed = self.ui_button_parse(line)
-                if parsed is not None:
-                    self.send("ok")
-                    returnData.append(parsed)
-
-            if line.startswith("ui bgcolor") or line.startswith("ui textcolor"):
-                parsed = self.ui_color_parse(line)
-                if parsed is not None:
-                    self.send("ok")
-                    returnData.append(parsed)
-
-            if line.startswith("ui icon"):
-                parsed = self.ui_icon_parse(line)
-                if parsed is not None:
-                    self.send("ok")
-                    returnData.append(parsed)
+                if line is not None and not self.binary:
+                    self._dispatch_line(line, returnData)
+
+                if line is None or self.handshake_complete_stage[1]:
+                    break
+                line = self._pop_line()
+
+        if self.binary:
+            while self._rx_frames:
+                self._dispatch_frame(self._rx_frames.popleft(), returnData)
+        else:
+            while (line := self._pop_line()) is not None:
+                self._dispatch_line(line, returnData)
 
         return returnData
@@ -1,41 +1,39 @@
-from comm import (
-    TickLoadingOutput,
-    UIButtonParseOutput,
-    UICleanParseOutput,
-    UIColorParseOutput,
-    UIIconParseOutput,
-)
-from .handle_loading_status import handle_loading_status
-from .handle_ui_button import handle_ui_button
-from .handle_ui_clean import handle_ui_clean
-from .handle_ui_color import handle_ui_color
-from .handle_ui_icon import handle_ui_icon
-
-
-def update_comm(self, dataList: list[dict] | None):
-    if dataList is None:
-        return
-
-    for data in dataList:
-        if data is None:
-            continue
-
-        if data["type"] == "loading_status":
-            data = TickLoadingOutput(data)
-            handle_loading_status(self, data)
-
-        if data["type"] == "ui_clean":
-            data = UICleanParseOutput(data)
-            handle_ui_clean(self, data)
-
-        if data["type"] == "ui_button":
-            data = UIButtonParseOutput(data)
-            handle_ui_button(self, data)
-
-        if data["type"] in ["ui_bgcolor", "ui_textcolor"]:
-            data = UIColorParseOutput(data)
-            handle_ui_color(self, data)
-
-        if data["type"] in ["ui_icon"]:
-            data = UIIconParseOutput(data)
-            handle_ui_icon(self, data)
+import traceback
+from stats import STATS
+from .registry import find_handler
+
+
+def update_comm(self, dataList: list[dict] | None) -> list[str | None]:
+    """
+    Applies every update that arrived in one tick. Returns, for each of them,
+    None if it was applied or the reason it wasn't, for Serial.answer().
+    """
+    if not dataList:
+        return []
+
+    # No batch here: Qt already paints everything changed in one tick in the
+    # same frame, and only the widgets that changed. Re-enabling updates
+    # after a batch repaints the whole grid, so that is left to "ui batch".
+    return [_apply(self, data) for data in dataList]
+
+
+def _apply(self, data: dict | None) -> str | None:
+    if data is None:
+        return None
+
+    handle = find_handler(data["type"])
+    if handle is None:
+        print(f"[WARN] No handler registered for update type {data['type']!r}")
+        return "unknown"
+
+    # A failing update must not keep the rest of the tick from being applied.
+    try:
+        with STATS.time(f"apply {data['type']}"):
+            handle(self, data)
+    except (IndexError, KeyError, ValueError, NotImplementedError) as e:
+        print(f"[WARN] Could not apply {data['type']}: {e!r}")
+        return "invalid"
+    except Exception:
+        traceback.print_exc()
+        return "failed"
+    return None
@@ -0,0 +1,56 @@
+from __future__ import annotations
+from typing import TYPE_CHECKING
+from comm import AssetBeginParseOutput, AssetChunkParseOutput, AssetEndParseOutput
+from .registry import handler
+
+if TYPE_CHECKING:
+    from app import SimpleWindow
+
+
+@handler("asset_begin")
+def handle_asset_begin(self: SimpleWindow, data: AssetBeginParseOutput):
+    try:
+        transfer = self.assets.begin(data["hash"], data["size"], data["chunk_size"])
+    except ValueError as e:
+        print(f"[WARN] Refusing asset {data['hash']}: {e}")
+        self.comm_port.send(f"asset refused {data['hash']}")
+        return
+
+    # Tells the host where to (re)start; chunks already received are kept.
+    self.comm_port.send(f"asset resume {data['hash']} {transfer.first_missing()}")
+
+
+@handler("asset_chunk")
+def handle_asset_chunk(self: SimpleWindow, data: AssetChunkParseOutput):
+    transfer = self.assets.transfers.get(data["hash"])
+    if transfer is None:
+        # e.g. the Pi restarted mid-transfer; the host starts over with begin.
+        self.comm_port.send(f"asset unknown {data['hash']}")
+        return
+
+    # A bad chunk raises ValueError, so the host is answered "invalid".
+    transfer.write_chunk(data["index"], data["data"])
+
+
+@handler("asset_end")
+def handle_asset_end(self: SimpleWindow, data: AssetEndParseOutput):
+    transfer = self.assets.transfers.get(data["hash"])
+    if transfer is None:
+        self.comm_port.send(f"asset unknown {data['hash']}")
+        return
+
+    missing = transfer.first_missing()
+    if missing != transfer.chunk_count:
+        # Some chunks got lost; have the host send the rest again.
+        self.comm_port.send(f"asset resume {data['hash']} {missing}")
+        return
+
+    asset = self.assets.finish(data["hash"])
+    if asset is None:
+        self.comm_port.send(f"asset corrupt {data['hash']}")
+        return
+
+    # Assets are addressed by content hash, same as icons, so a finished
+    # transfer goes straight into the icon cache and fills any waiting cell.
+    self.icon_cache.put(asset, data["hash"])
+    self.comm_port.send(f"asset done {data['hash']}")
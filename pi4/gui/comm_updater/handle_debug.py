@@ -0,0 +1,14 @@
+from __future__ import annotations
+from typing import TYPE_CHECKING
+from comm import DebugPressParseOutput
+from .registry import handler
+
+if TYPE_CHECKING:
+    from app import SimpleWindow
+
+
+@handler("debug_press")
+def handle_debug_press(self: SimpleWindow, data: DebugPressParseOutput):
+    # Presses the button on the shown page as if it had been tapped, so the
+    # full press path can be driven remotely (e.g. by the benchmarks).
+    self.grids[self.shown_page].button(data["x"], data["y"]).click()
@@ -1,5 +1,11 @@
+from __future__ import annotations
+from typing import TYPE_CHECKING
 from comm import TickLoadingOutput
-from app import SimpleWindow
+from .registry import handler
 
+if TYPE_CHECKING:
+    from app import SimpleWindow
+
+@handler("loading_status")
 def handle_loading_status(self:SimpleWindow, data:TickLoadingOutput):
     self.loading_widget.setText(data['data'])
\ No newline at end of file
@@ -0,0 +1,25 @@
+from __future__ import annotations
+from typing import TYPE_CHECKING
+import json
+from comm import PressDoneParseOutput, StatsParseOutput
+from stats import STATS
+from .registry import handler
+
+if TYPE_CHECKING:
+    from app import SimpleWindow
+
+
+@handler("stats")
+def handle_stats(self: SimpleWindow, data: StatsParseOutput):
+    self.comm_port.send("stats " + json.dumps(STATS.to_dict(), separators=(",", ":")))
+    if data["reset"]:
+        STATS.reset()
+
+
+@handler("press_done")
+def handle_press_done(self: SimpleWindow, data: PressDoneParseOutput):
+    # Sent by the host after the commands answering the press, so those have
+    # been applied by now; what is left is the repaint.
+    STATS.record("press host handling", data["host_seconds"])
+    STATS.hop(("press", data["press"]), "press -> response")
+    self.repaint_marks.append(data["press"])
@@ -0,0 +1,16 @@
+from __future__ import annotations
+from typing import TYPE_CHECKING
+from comm import UIBatchParseOutput
+from .registry import handler
+
+if TYPE_CHECKING:
+    from app import SimpleWindow
+
+
+@handler("ui_batch")
+def handle_ui_batch(self: SimpleWindow, data: UIBatchParseOutput):
+    if data["action"] == "begin":
+        self.main_grid.open_batch()
+
+    if data["action"] == "commit":
+        self.main_grid.commit_batch()
@@ -1,27 +1,58 @@
-from PySide6.QtWidgets import QPushButton
-from PySide6.QtCore import Slot
+from __future__ import annotations
+from typing import TYPE_CHECKING
 from comm import UIButtonParseOutput
-from app import SimpleWindow
-from widgets.scalable_button import ScalableButton
+from .registry import handler
 import shlex
+from stats import STATS
 
+if TYPE_CHECKING:
+    from app import SimpleWindow
+
+@handler("ui_button")
 def handle_ui_button(self: SimpleWindow, data: UIButtonParseOutput):
-    btn = ScalableButton(data["text"])
-    
+    action = None
+
     if data['broadcast']:
         
         def broadcast_on_click():
-            self.comm_port.send(shlex.join(["broadcast", "recieve", data["message"]]))
+            # Timed until the host's response is on screen; see handle_stats.
+            press = next(self.press_ids)
+            STATS.begin(("press", press))
+            self.comm_port.send(
+                shlex.join(["broadcast", "recieve", data["message"], f"press={press}"])
+            )
+            STATS.hop(("press", press), "press -> write")
             
-        btn.clicked.connect(broadcast_on_click)
+        action = broadcast_on_click
     
 
     supported_dispatches = ["nop"]
 
     if not data["broadcast"]:
-        if data["message"].lower() not in supported_dispatches:
+        if data["message"].startswith("page:"):
+            # Page switches happen on the Pi, without asking the host.
+            page = data["message"].removeprefix("page:")
+            if page == "back":
+                action = self.back_page
+            else:
+                action = lambda: self.show_page(page)
+        elif data["message"].lower() not in supported_dispatches:
             raise NotImplementedError
 
-    self.main_grid.addWidget(
-        btn, x=data["x"], y=data["y"], x_span=data["x_span"], y_span=data["y_span"]
+    self.main_grid.set_button(
+        data["x"],
+        data["y"],
+        text=data["text"],
+        x_span=data["x_span"],
+        y_span=data["y_span"],
+        action=action,
+    )
+    self.main_grid.state.set_button(
+        data["x"],
+        data["y"],
+        data["text"],
+        data["x_span"],
+        data["y_span"],
+        "broadcast" if data["broadcast"] else "dispatch",
+        data["message"],
     )
@@ -1,8 +1,14 @@
+from __future__ import annotations
+from typing import TYPE_CHECKING
 from comm import UICleanParseOutput
-from app import SimpleWindow
+from .registry import handler
 
+if TYPE_CHECKING:
+    from app import SimpleWindow
 
+
+@handler("ui_clean")
 def handle_ui_clean(self:SimpleWindow, data:UICleanParseOutput):
-    self.loading_widget.hide()
-    self.main_grid.show()
-    self.main_grid.resizeGrid(data['width'], data['height'])
\ No newline at end of file
+    self.main_grid.resizeGrid(data['width'], data['height'])
+    self.main_grid.state.clean(data['width'], data['height'])
+    self.reveal_pages()
\ No newline at end of file
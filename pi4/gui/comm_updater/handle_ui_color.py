@@ -1,18 +1,26 @@
+from __future__ import annotations
+from typing import TYPE_CHECKING
 from comm import UIColorParseOutput
-from app import SimpleWindow
+from .registry import handler
 from widgets.scalable_button import ScalableButton
 
+if TYPE_CHECKING:
+    from app import SimpleWindow
 
+
+@handler("ui_bgcolor", "ui_textcolor")
 def handle_ui_color(self: SimpleWindow, data: UIColorParseOutput):
     type = data['type']
     x = data['x']
     y = data['y']
     color = data['color']
     
-    widget:ScalableButton = self.main_grid.widgets[x, y]
+    widget:ScalableButton = self.main_grid.button(x, y)
     
     if type == "ui_bgcolor":
         widget.set_background_color(color)
     
     if type == "ui_textcolor":
-        widget.set_text_color(color)
\ No newline at end of file
+        widget.set_text_color(color)
+
+    self.main_grid.state.set_color(x, y, type.removeprefix("ui_"), color)
\ No newline at end of file
@@ -1,24 +1,41 @@
-from comm import UIIconParseOutput
-from app import SimpleWindow
-from widgets.scalable_button import ScalableButton
-from PIL import Image
-from PIL.ImageQt import ImageQt
-from io import BytesIO
-import base64
-from PySide6.QtGui import QPixmap, QIcon
+from __future__ import annotations
+from typing import TYPE_CHECKING
+from comm import IconPutParseOutput, UIIconParseOutput, UIIconRefParseOutput
+from .registry import handler
+from icon_cache import icon_hash
 
+if TYPE_CHECKING:
+    from app import SimpleWindow
 
+# Decoding happens on the icon cache's worker pool. Cells whose icon isn't
+# decoded yet are filled in by SimpleWindow.on_icon_ready once it is.
+
+
+def _show_icon(self: SimpleWindow, x: int, y: int, key: str) -> bool:
+    """Shows a cached icon right away. Returns False if it isn't in memory."""
+    icon = self.icon_cache.get(key)
+    self.main_grid.set_icon(x, y, key, icon)
+    self.main_grid.state.set_icon(x, y, key)
+    return icon is not None
+
+
+@handler("ui_icon")
 def handle_ui_icon(self: SimpleWindow, data: UIIconParseOutput):
-    x = data["x"]
-    y = data["y"]
-    base64icon = data["base64icon"]
+    key = icon_hash(data["icon"])
+    if not _show_icon(self, data["x"], data["y"], key):
+        self.icon_cache.put(data["icon"], key)
+
+
+@handler("ui_icon_ref")
+def handle_ui_icon_ref(self: SimpleWindow, data: UIIconRefParseOutput):
+    if not _show_icon(self, data["x"], data["y"], data["hash"]):
+        # Tries the disk cache, then asks the host via on_icon_missing.
+        self.icon_cache.load(data["hash"])
 
-    widget: ScalableButton = self.main_grid.widgets[x, y]
 
-    print(base64icon)
-    
-    image = Image.open(BytesIO(base64.b64decode(base64icon)))
-    qimage = ImageQt(image)
-    icon = QIcon(QPixmap.fromImage(qimage))
+@handler("icon_put")
+def handle_icon_put(self: SimpleWindow, data: IconPutParseOutput):
+    if icon_hash(data["icon"]) != data["hash"]:
+        raise ValueError(f"Icon upload does not match its hash {data['hash']}")
 
-    widget.setIcon(icon)
+    self.icon_cache.put(data["icon"], data["hash"])
@@ -0,0 +1,19 @@
+from __future__ import annotations
+from typing import TYPE_CHECKING
+from comm import UIPageParseOutput
+from .registry import handler
+
+if TYPE_CHECKING:
+    from app import SimpleWindow
+
+
+@handler("ui_page")
+def handle_ui_page(self: SimpleWindow, data: UIPageParseOutput):
+    if data["action"] == "begin":
+        self.begin_page(data["name"])
+
+    if data["action"] == "end":
+        self.end_page()
+
+    if data["action"] == "show":
+        self.show_page(data["name"])
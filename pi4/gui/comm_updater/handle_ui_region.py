@@ -0,0 +1,42 @@
+from __future__ import annotations
+from typing import TYPE_CHECKING
+from comm import UIRegionParseOutput, UITextParseOutput
+from .registry import handler
+
+if TYPE_CHECKING:
+    from app import SimpleWindow
+
+
+@handler("ui_region")
+def handle_ui_region(self: SimpleWindow, data: UIRegionParseOutput):
+    # However many cells change, Qt paints them in the same frame.
+    grid = self.main_grid
+    field = data["field"]
+    value = data["value"]
+    cells = grid.state.region(data["cells"])
+
+    if field == "icon":
+        icon = self.icon_cache.get(value)
+        for x, y in cells:
+            grid.set_icon(x, y, value, icon)
+            grid.state.set_icon(x, y, value)
+        if cells and icon is None:
+            self.icon_cache.load(value)
+        return
+
+    for x, y in cells:
+        widget = grid.widgets[x, y]
+        if field == "bgcolor":
+            widget.set_background_color(value)
+        elif field == "textcolor":
+            widget.set_text_color(value)
+        else:
+            widget.setText(value)
+        grid.state.set_field(x, y, field, value)
+
+
+@handler("ui_text")
+def handle_ui_text(self: SimpleWindow, data: UITextParseOutput):
+    # Unlike a region, a single cell off the grid is an error.
+    self.main_grid.button(data["x"], data["y"]).setText(data["text"])
+    self.main_grid.state.set_text(data["x"], data["y"], data["text"])
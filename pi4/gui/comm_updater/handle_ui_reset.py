@@ -0,0 +1,13 @@
+from __future__ import annotations
+from typing import TYPE_CHECKING
+from comm import UIResetParseOutput
+from .registry import handler
+
+if TYPE_CHECKING:
+    from app import SimpleWindow
+
+
+@handler("ui_reset")
+def handle_ui_reset(self: SimpleWindow, data: UIResetParseOutput):
+    self.main_grid.reset_cell(data["x"], data["y"])
+    self.main_grid.state.reset_cell(data["x"], data["y"])
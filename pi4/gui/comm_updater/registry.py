@@ -0,0 +1,53 @@
+import importlib
+from typing import Callable
+
+Handler = Callable[..., None]
+
+# Maps the "type" of a parsed update dict to the function that applies it to
+# the window. Populated with the @handler decorator.
+HANDLERS: dict[str, Handler] = {}
+
+# The module whose @handler registrations cover each type. It is imported the
+# first time an update of that type arrives, so start up doesn't pay for
+# handlers (and their imports) that may never be needed.
+HANDLER_MODULES = {
+    "asset_begin": "handle_asset",
+    "asset_chunk": "handle_asset",
+    "asset_end": "handle_asset",
+    "debug_press": "handle_debug",
+    "loading_status": "handle_loading_status",
+    "stats": "handle_stats",
+    "press_done": "handle_stats",
+    "ui_batch": "handle_ui_batch",
+    "ui_button": "handle_ui_button",
+    "ui_clean": "handle_ui_clean",
+    "ui_bgcolor": "handle_ui_color",
+    "ui_textcolor": "handle_ui_color",
+    "ui_icon": "handle_ui_icon",
+    "ui_icon_ref": "handle_ui_icon",
+    "icon_put": "handle_ui_icon",
+    "ui_page": "handle_ui_page",
+    "ui_region": "handle_ui_region",
+    "ui_text": "handle_ui_region",
+    "ui_reset": "handle_ui_reset",
+}
+
+
+def handler(*types: str):
+    """Registers the decorated function as the handler for each of `types`."""
+
+    def decorator(func: Handler):
+        for type in types:
+            HANDLERS[type] = func
+        return func
+
+    return decorator
+
+
+def find_handler(type: str) -> Handler | None:
+    """Returns the handler for `type`, importing its module if need be."""
+    handle = HANDLERS.get(type)
+    if handle is None and type in HANDLER_MODULES:
+        importlib.import_module(f"{__package__}.{HANDLER_MODULES[type]}")
+        handle = HANDLERS.get(type)
+    return handle
@@ -0,0 +1,167 @@
+import hashlib
+import os
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from io import BytesIO
+from PySide6.QtCore import QObject, Signal
+from PySide6.QtGui import QIcon, QImage, QPixmap
+from assets import CONTENT_KEY, MAX_ASSET_SIZE
+
+# Icons are addressed by "sha256:<hex digest of the image file bytes>".
+HASH_PREFIX = "sha256:"
+
+DEFAULT_DISK_DIR = os.path.join(
+    os.environ.get("XDG_CACHE_HOME", os.path.expanduser("~/.cache")), "pideck", "icons"
+)
+
+
+def icon_hash(data: bytes) -> str:
+    return HASH_PREFIX + hashlib.sha256(data).hexdigest()
+
+
+def decode_icon(data: bytes) -> QImage:
+    # PIL is only needed once an icon turns up, which may be long after start
+    # up (or never), so it is imported here, on the worker pool.
+    from PIL import Image
+    from PIL.ImageQt import ImageQt
+
+    image = Image.open(BytesIO(data))
+    # ImageQt shares PIL's buffer, so detach it before `image` goes away.
+    return QImage(ImageQt(image)).copy()
+
+
+class IconCache(QObject):
+    """
+    Content-addressed icon store. Decoded icons are kept in a size-bounded
+    LRU in memory, one QIcon per key so every cell showing it shares the
+    scaled copies ScalableButton caches by QIcon.cacheKey(); the original
+    image bytes are optionally written to `disk_dir` so icons survive a
+    restart without being sent again.
+
+    Reading and decoding happen on a worker pool. Only the QImage to QPixmap
+    conversion runs on the GUI thread, after which icon_ready is emitted. A key
+    that is neither in memory nor on disk emits icon_missing instead.
+    """
+
+    icon_ready = Signal(str, QIcon)
+    icon_missing = Signal(str)
+
+    # Emitted from worker threads; delivered on the GUI thread.
+    _decoded = Signal(str, QImage)
+    _not_found = Signal(str)
+    _failed = Signal(str)
+
+    def __init__(
+        self, max_items: int = 256, disk_dir: str | None = None, workers: int = 2
+    ):
+        super().__init__()
+        self.max_items = max_items
+        self.disk_dir = disk_dir
+        self._icons: OrderedDict[str, QIcon] = OrderedDict()
+        self._in_flight: set[str] = set()
+        self._pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="icon")
+
+        self._decoded.connect(self._on_decoded)
+        self._not_found.connect(self._on_not_found)
+        self._failed.connect(self._on_failed)
+
+        if self.disk_dir is not None:
+            os.makedirs(self.disk_dir, exist_ok=True)
+
+    def _disk_path(self, key: str) -> str | None:
+        """Where `key` is kept on disk; None without a disk cache or a valid key."""
+        if self.disk_dir is None or not CONTENT_KEY.fullmatch(key):
+            return None
+        return os.path.join(self.disk_dir, key.removeprefix(HASH_PREFIX))
+
+    def read_bytes(self, key: str) -> bytes | None:
+        """Returns the image bytes stored on disk for `key`, if any."""
+        path = self._disk_path(key)
+        if path is None:
+            return None
+        try:
+            with open(path, "rb") as file:
+                # Nothing larger could have been uploaded.
+                data = file.read(MAX_ASSET_SIZE + 1)
+        except OSError:
+            return None
+        if len(data) > MAX_ASSET_SIZE or icon_hash(data) != key:
+            return None
+        return data
+
+    def _write_bytes(self, key: str, data: bytes):
+        path = self._disk_path(key)
+        if path is None or os.path.exists(path):
+            return
+        try:
+            with open(path + ".tmp", "wb") as file:
+                file.write(data)
+            os.replace(path + ".tmp", path)
+        except OSError as e:
+            print(f"[WARN] Could not write icon cache entry {key}: {e}")
+
+    def has(self, key: str) -> bool:
+        """Whether `key` can be shown without asking the host for it."""
+        if key in self._icons:
+            return True
+        path = self._disk_path(key)
+        return path is not None and os.path.exists(path)
+
+    def get(self, key: str) -> QIcon | None:
+        """Returns the icon for `key` if it is decoded and in memory."""
+        icon = self._icons.get(key)
+        if icon is not None:
+            self._icons.move_to_end(key)
+        return icon
+
+    def load(self, key: str):
+        """Loads `key` from disk in the background."""
+        if key in self._in_flight:
+            return
+        self._in_flight.add(key)
+        self._pool.submit(self._load_job, key)
+
+    def put(self, data: bytes, key: str | None = None) -> str:
+        """Decodes and stores `data` in the background, returning its key."""
+        if key is None:
+            key = icon_hash(data)
+        if key not in self._in_flight:
+            self._in_flight.add(key)
+            self._pool.submit(self._put_job, key, data)
+        return key
+
+    def _load_job(self, key: str):
+        data = self.read_bytes(key)
+        if data is None:
+            self._not_found.emit(key)
+            return
+        self._decode_job(key, data)
+
+    def _put_job(self, key: str, data: bytes):
+        self._write_bytes(key, data)
+        self._decode_job(key, data)
+
+    def _decode_job(self, key: str, data: bytes):
+        try:
+            image = decode_icon(data)
+        except Exception as e:  # PIL raises a variety of errors for bad data
+            print(f"[WARN] Could not decode icon {key}: {e}")
+            self._failed.emit(key)
+            return
+        self._decoded.emit(key, image)
+
+    def _on_decoded(self, key: str, image: QImage):
+        self._in_flight.discard(key)
+        icon = QIcon(QPixmap.fromImage(image))
+        self._icons[key] = icon
+        self._icons.move_to_end(key)
+        if len(self._icons) > self.max_items:
+            self._icons.popitem(last=False)
+        self.icon_ready.emit(key, icon)
+
+    def _on_not_found(self, key: str):
+        self._in_flight.discard(key)
+        self.icon_missing.emit(key)
+
+    def _on_failed(self, key: str):
+        self._in_flight.discard(key)
@@ -0,0 +1,51 @@
+import os
+import time
+from stats import STATS
+
+# Imported first thing by app.py, so the clock below starts before Qt and
+# everything else is loaded.
+
+
+def _process_age() -> float | None:
+    """Seconds since this process was started, or None if it can't be told."""
+    try:
+        with open("/proc/self/stat") as file:
+            # Field 22 is the start time in clock ticks since boot; the command
+            # name (field 2) may contain spaces, so count from its ")".
+            start_ticks = int(file.read().rpartition(")")[2].split()[19])
+        with open("/proc/uptime") as file:
+            uptime = float(file.read().split()[0])
+    except (OSError, ValueError, IndexError):
+        return None
+    return max(0.0, uptime - start_ticks / os.sysconf("SC_CLK_TCK"))
+
+
+class StartupProfile:
+    """
+    Wall clock time of each start up phase: mark(phase) ends the phase that
+    began at the previous mark. Phases are also recorded in STATS as
+    "startup <phase>", so the host can read them with "stats".
+    """
+
+    def __init__(self):
+        self.phases: list[tuple[str, float]] = []
+        self._last = time.perf_counter()
+        age = _process_age()
+        if age is not None:
+            self.phases.append(("interpreter", age))
+
+    def mark(self, phase: str):
+        now = time.perf_counter()
+        self.phases.append((phase, now - self._last))
+        STATS.record(f"startup {phase}", now - self._last)
+        self._last = now
+
+    def report(self) -> str:
+        width = max([len("total"), *(len(phase) for phase, _ in self.phases)])
+        lines = [f"{phase:<{width}} {seconds * 1000:8.1f} ms" for phase, seconds in self.phases]
+        total = sum(seconds for _, seconds in self.phases)
+        lines.append(f"{'total':<{width}} {total * 1000:8.1f} ms")
+        return "\n".join(lines)
+
+
+STARTUP = StartupProfile()
@@ -1,9 +1,17 @@
 from PySide6.QtWidgets import QLabel, QGridLayout, QWidget, QApplication, QPushButton, QSizePolicy
 from PySide6.QtCore import QTimer, QSize, Qt
+from PySide6.QtGui import QIcon
 import sys
+from contextlib import contextmanager
+from typing import Callable
 from widgets.scalable_button import ScalableButton
+from layout import Layout
 import random
 
+# An explicit batch that is never committed (e.g. the host died halfway through
+# a page) is committed anyway after this long, so the grid can't stay frozen.
+BATCH_TIMEOUT_MS = 2000
+
 class MainGridWidget(QWidget):
     def __init__(self, width: int, height: int):
         super().__init__()
@@ -15,13 +23,88 @@ class MainGridWidget(QWidget):
         self.array_size = (width, height)
 
         self.widgets: dict[tuple[int, int], QWidget] = {}
+        self.spans: dict[tuple[int, int], tuple[int, int]] = {}
+        self.actions: dict[tuple[int, int], Callable[[], None]] = {}
+        # Content hash of the icon each cell shows, or is still waiting for.
+        self.icons: dict[tuple[int, int], str] = {}
+        # What the host has drawn so far, kept in step by the comm handlers.
+        self.state = Layout()
+
+        # Spans the whole grid underneath the buttons. Created once and
+        # re-spanned on every resizeGrid().
+        self.filler = QLabel()
+
+        self._batch_depth = 0
+        self._batch_open = False
+        self.batch_timer = QTimer()
+        self.batch_timer.setSingleShot(True)
+        self.batch_timer.timeout.connect(self.commit_batch)
 
         self.resizeGrid(width, height)
 
         self.setLayout(self.gridlayout)
         
 
+    def begin_batch(self):
+        """
+        Suspends repaints until the matching end_batch(), so a run of changes
+        is shown in a single frame. Batches nest.
+        """
+        self._batch_depth += 1
+        if self._batch_depth == 1:
+            self.setUpdatesEnabled(False)
+
+    def end_batch(self):
+        if self._batch_depth == 0:
+            return
+        self._batch_depth -= 1
+        if self._batch_depth == 0:
+            # Re-enabling updates schedules one repaint of the whole grid.
+            self.setUpdatesEnabled(True)
+
+    @contextmanager
+    def batch(self):
+        self.begin_batch()
+        try:
+            yield
+        finally:
+            self.end_batch()
+
+    @property
+    def is_batch_open(self) -> bool:
+        return self._batch_open
+
+    def open_batch(self):
+        """Starts a batch that stays open across ticks until commit_batch()."""
+        if self._batch_open:
+            return
+        self._batch_open = True
+        self.begin_batch()
+        self.batch_timer.start(BATCH_TIMEOUT_MS)
+
+    def commit_batch(self):
+        if not self._batch_open:
+            return
+        self._batch_open = False
+        self.batch_timer.stop()
+        self.end_batch()
+
     def addWidget(self, widget: QWidget, x: int, y: int, x_span=1, y_span=1, save=True):
+        self._check_bounds(x, y)
+
+        if save:
+            old_wg = self.widgets.get((x, y))
+            if old_wg is not None and old_wg is not widget:
+                self.gridlayout.removeWidget(old_wg)
+                old_wg.deleteLater()
+            self.widgets[(x, y)] = widget
+        widget.setSizePolicy(QSizePolicy.Expanding, QSizePolicy.Expanding)
+
+        self.gridlayout.addWidget(widget, y, x, y_span, x_span)
+
+    def _check_bounds(self, x: int, y: int):
+        if x < 0 or y < 0:
+            raise IndexError(f"({x}, {y}) is not a cell of this layout configuration.")
         if x >= self.array_size[0]:
             raise IndexError(
                 f"x={x} is not in range of this layout configuration (w={self.array_size[0]}, h={self.array_size[1]}). Use MainGridWidget.resizeGrid() to change to a minimum of width={x+1}."
@@ -31,36 +114,110 @@ class MainGridWidget(QWidget):
                 f"y={y} is not in range of this layout configuration {self.array_size}. Use MainGridWidget.resizeGrid() to change to a minimum of height={y+1}."
             )
 
-        old_wg = self.widgets.get((x, y))
-
-        if old_wg is not None:
-            old_wg.deleteLater()
-
-        if save:
-            self.widgets[(x, y)] = widget
-        widget.setSizePolicy(QSizePolicy.Expanding, QSizePolicy.Expanding)
-
+    def button(self, x: int, y: int) -> ScalableButton:
+        """The pooled button at (x, y). Raises IndexError if it is off the grid."""
+        self._check_bounds(x, y)
+        return self.widgets[x, y]
+
+    def _create_button(self, x: int, y: int) -> ScalableButton:
+        btn = ScalableButton()
+        # Connected once for the lifetime of the button; what a click does is
+        # looked up in self.actions so the button can be reused.
+        btn.clicked.connect(lambda: self._on_cell_clicked(x, y))
+        self.addWidget(btn, x, y)
+        self.spans[(x, y)] = (1, 1)
+        return btn
+
+    def _on_cell_clicked(self, x: int, y: int):
+        action = self.actions.get((x, y))
+        if action is not None:
+            action()
+
+    def set_span(self, x: int, y: int, x_span: int, y_span: int):
+        if self.spans.get((x, y)) == (x_span, y_span):
+            return
+        widget = self.widgets[x, y]
+        self.gridlayout.removeWidget(widget)
         self.gridlayout.addWidget(widget, y, x, y_span, x_span)
+        self.spans[(x, y)] = (x_span, y_span)
+        if x_span > 1 or y_span > 1:
+            # Draw over the cells this one now covers.
+            widget.raise_()
+
+    def set_button(
+        self,
+        x: int,
+        y: int,
+        text: str,
+        x_span=1,
+        y_span=1,
+        action: Callable[[], None] | None = None,
+    ):
+        """Updates the pooled button at (x, y) in place."""
+        self._check_bounds(x, y)
+        btn: ScalableButton = self.widgets[x, y]
+        btn.setText(text)
+        self.set_span(x, y, x_span, y_span)
+        if action is None:
+            self.actions.pop((x, y), None)
+        else:
+            self.actions[(x, y)] = action
+
+    def set_icon(self, x: int, y: int, icon_hash: str, icon: QIcon | None):
+        """
+        Sets the icon of the cell at (x, y). `icon` may be None if the image
+        isn't available yet; apply_icon() fills it in once it arrives.
+        """
+        self._check_bounds(x, y)
+        self.icons[(x, y)] = icon_hash
+        self.widgets[x, y].setIcon(icon if icon is not None else QIcon())
+
+    def apply_icon(self, icon_hash: str, icon: QIcon):
+        """Sets `icon` on every cell that refers to `icon_hash`."""
+        for cell, cell_hash in self.icons.items():
+            if cell_hash == icon_hash:
+                self.widgets[cell].setIcon(icon)
+
+    def reset_cell(self, x: int, y: int):
+        self._check_bounds(x, y)
+        self.widgets[x, y].reset()
+        self.set_span(x, y, 1, 1)
+        self.actions.pop((x, y), None)
+        self.icons.pop((x, y), None)
 
     def resizeGrid(self, width: int, height: int):
-        for i in reversed(range(self.gridlayout.count())):
-            self.gridlayout.itemAt(i).widget().deleteLater()
-
+        """
+        Resizes the grid and resets every cell. Buttons that are still inside
+        the new size are reused; only the difference is created or destroyed.
+        """
+        old_width, old_height = self.array_size
         self.array_size = (width, height)
 
-        self.widgets = {}
+        for (x, y), widget in list(self.widgets.items()):
+            if x < width and y < height:
+                continue
+            self.gridlayout.removeWidget(widget)
+            widget.deleteLater()
+            del self.widgets[(x, y)]
+            self.spans.pop((x, y), None)
+            self.actions.pop((x, y), None)
+            self.icons.pop((x, y), None)
+
+        for x in range(max(width, old_width)):
+            self.gridlayout.setColumnStretch(x, 1 if x < width else 0)
+        for y in range(max(height, old_height)):
+            self.gridlayout.setRowStretch(y, 1 if y < height else 0)
+
+        self.gridlayout.removeWidget(self.filler)
+        self.addWidget(self.filler, 0, 0, width, height, save=False)
+        self.filler.lower()
 
-        for x in range(width):
-            self.gridlayout.setColumnStretch(x, 1)
-        for y in range(height):
-            self.gridlayout.setRowStretch(y, 1)
-        
-        self.addWidget(QLabel(), 0, 0, width, height, save=False)
         for x in range(width):
             for y in range(height):
-                btn = ScalableButton()
-                # btn = QPushButton()
-                self.addWidget(btn, x, y)
+                if (x, y) in self.widgets:
+                    self.reset_cell(x, y)
+                else:
+                    self._create_button(x, y)
 
 
 if __name__ == "__main__":
@@ -2,14 +2,73 @@ from PySide6.QtWidgets import (
     QPushButton,
     QApplication,
     QSizePolicy,
+    QStyle,
+    QStyleOptionButton,
     QWidget,
     QGridLayout,
 )
-from PySide6.QtCore import QSize, Qt, QEvent
-from PySide6.QtGui import QFont, QFontMetrics, QIcon, QPixmap, QPainter
+from PySide6.QtCore import QRectF, QSize, Qt, QEvent
+from PySide6.QtGui import (
+    QColor,
+    QFont,
+    QFontMetrics,
+    QIcon,
+    QPainter,
+    QPalette,
+    QPen,
+    QPixmap,
+)
+from collections import OrderedDict
 import sys
 
 
+class LRUCache:
+    """
+    Size-bounded least-recently-used memo with hit/miss counters, shared by
+    every ScalableButton in the process.
+    """
+
+    def __init__(self, maxsize: int):
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        self._entries: OrderedDict[tuple, object] = OrderedDict()
+
+    def get(self, key: tuple):
+        value = self._entries.get(key)
+        if value is None:
+            self.misses += 1
+            return None
+        self._entries.move_to_end(key)
+        self.hits += 1
+        return value
+
+    def put(self, key: tuple, value):
+        self._entries[key] = value
+        self._entries.move_to_end(key)
+        if len(self._entries) > self.maxsize:
+            self._entries.popitem(last=False)
+
+    def clear(self):
+        self._entries.clear()
+        self.hits = 0
+        self.misses = 0
+
+    def __len__(self):
+        return len(self._entries)
+
+
+# Font-fit results keyed by (text, font family, available width, available
+# height, icon width). Buttons with the same label and cell size share a single
+# binary search, which matters when a whole grid resizes at once.
+FONT_FIT_CACHE = LRUCache(maxsize=4096)
+
+# Pre-scaled icon pixmaps keyed by (QIcon.cacheKey(), width, height), so cells
+# showing the same icon at the same size share one scaled copy. That takes the
+# same QIcon, which is why IconCache hands out one per image.
+SCALED_ICON_CACHE = LRUCache(maxsize=512)
+
+
 class ScalableButton(QPushButton):
     """
     A QPushButton subclass that automatically scales its text font size and icon size
@@ -17,6 +76,12 @@ class ScalableButton(QPushButton):
     and then elide horizontally if necessary. Icons will scale proportionally.
     """
 
+    DEFAULT_BACKGROUND_COLOR = "#f0f0f0"  # Default light background
+    DEFAULT_TEXT_COLOR = "#333333"  # Default dark text
+    BORDER_COLOR = QColor("#b3b3b3")  # Default light gray border
+    PRESSED_BORDER_COLOR = QColor("#808080")  # Darker border when pressed
+    BORDER_RADIUS = 5  # Slightly rounded corners
+
     def __init__(self, text="", icon: QIcon = QIcon(), parent=None):
         """
         Initializes the ScalableButton.
@@ -28,6 +93,10 @@ class ScalableButton(QPushButton):
         """
         super().__init__(text, parent)
         self.original_icon = icon  # Store the original icon to enable proper rescaling
+        self._icon_aspect_ratio = self._aspect_ratio_of(icon)
+        # The icon pre-scaled to the current icon size, drawn in paintEvent()
+        self._scaled_icon: QIcon | None = None
+        self._scaled_icon_key: tuple | None = None
         if not self.original_icon.isNull():
             # Set the icon initially without specific size, size will be adjusted in _adjust_content_size
             super().setIcon(self.original_icon)
@@ -40,11 +109,11 @@ class ScalableButton(QPushButton):
         self._current_icon_size = self.iconSize()
 
         # Store color attributes with default values
-        self._background_color = "#f0f0f0"  # Default light background
-        self._text_color = "#333333"  # Default dark text
+        self._background_color = self.DEFAULT_BACKGROUND_COLOR
+        self._text_color = self.DEFAULT_TEXT_COLOR
 
-        # Apply the initial stylesheet based on default colors
-        self._update_stylesheet()
+        # Resolve the default colors for painting
+        self._update_colors()
 
     def _darken_color(self, hex_color: str, factor: float = 0.85) -> str:
         """
@@ -77,28 +146,59 @@ class ScalableButton(QPushButton):
 
         return f"#{r:02x}{g:02x}{b:02x}"
 
-    def _update_stylesheet(self):
+    def _parse_color(self, color: str) -> QColor:
         """
-        Internal method to construct and apply the button's stylesheet
-        based on its current background and text color attributes.
+        Turns a color string into a QColor. Accepts everything QColor does
+        (e.g. "#RRGGBB", "red") plus the stylesheet "rgb(R,G,B)" form.
         """
-        hover_bg_color = self._darken_color(self._background_color)
-
-        stylesheet = f"""
-            QPushButton {{
-                padding: 0px; /* Crucial: Remove default padding to maximize content area */
-                border: 1px solid #b3b3b3; /* Default light gray border */
-                background-color: {self._background_color};
-                color: {self._text_color};
-                border-radius: 5px; /* Slightly rounded corners */
-                text-align: center; /* Explicitly center text, though usually default */
-            }}
-            QPushButton:pressed {{
-                background-color: {hover_bg_color}; /* Even darker when pressed (fixed for simplicity) */
-                border: 1px solid #808080; /* Even darker border when pressed (fixed for simplicity) */
-            }}
+        qcolor = QColor(color)
+        if not qcolor.isValid() and color.startswith("rgb(") and color.endswith(")"):
+            try:
+                qcolor = QColor(*(int(part) for part in color[4:-1].split(",")))
+            except (TypeError, ValueError):
+                pass
+        return qcolor
+
+    def _update_colors(self):
+        """
+        Internal method to resolve the button's colors for painting. Colors are
+        drawn directly in paintEvent(), so changing them never re-parses a
+        stylesheet or re-polishes the widget.
+        """
+        self._background_qcolor = self._parse_color(self._background_color)
+        self._pressed_background_qcolor = QColor(
+            self._darken_color(self._background_color)
+        )
+        self._text_qcolor = self._parse_color(self._text_color)
+        self.update()
+
+    def paintEvent(self, event: QEvent):
+        """
+        Paints the rounded background and border, then lets the style draw the
+        icon and text on top using the button's text color.
         """
-        self.setStyleSheet(stylesheet)
+        painter = QPainter(self)
+        painter.setRenderHint(QPainter.Antialiasing)
+
+        if self.isDown():
+            painter.setPen(QPen(self.PRESSED_BORDER_COLOR, 1))
+            painter.setBrush(self._pressed_background_qcolor)
+        else:
+            painter.setPen(QPen(self.BORDER_COLOR, 1))
+            painter.setBrush(self._background_qcolor)
+        painter.drawRoundedRect(
+            QRectF(self.rect()).adjusted(0.5, 0.5, -0.5, -0.5),
+            self.BORDER_RADIUS,
+            self.BORDER_RADIUS,
+        )
+
+        option = QStyleOptionButton()
+        self.initStyleOption(option)
+        option.palette.setColor(QPalette.ButtonText, self._text_qcolor)
+        if self._scaled_icon is not None:
+            # Already at option.iconSize, so the style doesn't rescale it.
+            option.icon = self._scaled_icon
+        self.style().drawControl(QStyle.CE_PushButtonLabel, option, painter, self)
 
     def set_background_color(self, color: str):
         """
@@ -106,10 +206,12 @@ class ScalableButton(QPushButton):
 
         Args:
             color (str): The color string (e.g., "#RRGGBB", "rgb(R,G,B)", "red", "blue").
-            Note: For consistent hover darkening, using hex color codes is recommended.
+            Note: For consistent pressed-state darkening, using hex color codes is recommended.
         """
+        if color == self._background_color:
+            return
         self._background_color = color
-        self._update_stylesheet()
+        self._update_colors()
 
     def set_text_color(self, color: str):
         """
@@ -118,8 +220,38 @@ class ScalableButton(QPushButton):
         Args:
             color (str): The color string (e.g., "#RRGGBB", "rgb(R,G,B)", "red", "blue").
         """
+        if color == self._text_color:
+            return
         self._text_color = color
-        self._update_stylesheet()
+        self._update_colors()
+
+    def sizeHint(self) -> QSize:
+        """
+        The content is scaled to whatever size the layout gives the button, so
+        the current (possibly large) font must not feed back into the layout.
+        Otherwise a reused button would keep the size of the cell it came from.
+        """
+        return QSize(1, 1)
+
+    def minimumSizeHint(self) -> QSize:
+        return QSize(1, 1)
+
+    def reset(self):
+        """
+        Clears the text, icon and colors so the button can be reused for
+        another cell instead of being destroyed and recreated.
+        """
+        if self.text():
+            self.setText("")
+        if not self.original_icon.isNull():
+            self.setIcon(QIcon())
+        if (self._background_color, self._text_color) != (
+            self.DEFAULT_BACKGROUND_COLOR,
+            self.DEFAULT_TEXT_COLOR,
+        ):
+            self._background_color = self.DEFAULT_BACKGROUND_COLOR
+            self._text_color = self.DEFAULT_TEXT_COLOR
+            self._update_colors()
 
     def resizeEvent(self, event: QEvent):
         """
@@ -155,11 +287,52 @@ class ScalableButton(QPushButton):
         """
         # Store the original icon so we always scale from the source, not a scaled version
         self.original_icon = icon
+        self._icon_aspect_ratio = self._aspect_ratio_of(icon)
+        self._update_scaled_icon(QSize(0, 0))
         # Set the new icon on the QPushButton, its size will be adjusted next
         super().setIcon(icon)
         # Re-adjust content size as the icon content has changed
         self._adjust_content_size()
 
+    def _aspect_ratio_of(self, icon: QIcon) -> float | None:
+        """
+        Returns the width/height ratio of the icon's largest size. actualSize()
+        only looks the size up, so no pixmap gets rendered for this.
+        """
+        if icon.isNull():
+            return None
+        size = icon.actualSize(QSize(1000, 1000))
+        if size.width() <= 0 or size.height() <= 0:
+            return None
+        return size.width() / size.height()
+
+    def _update_scaled_icon(self, icon_size: QSize):
+        """
+        Makes sure _scaled_icon holds the original icon scaled to `icon_size`.
+        Only does work when the icon or the size actually changed.
+        """
+        if self.original_icon.isNull() or icon_size.isEmpty():
+            self._scaled_icon = None
+            self._scaled_icon_key = None
+            return
+
+        key = (self.original_icon.cacheKey(), icon_size.width(), icon_size.height())
+        if key == self._scaled_icon_key:
+            return
+
+        pixmap = SCALED_ICON_CACHE.get(key)
+        if pixmap is None:
+            source = self.original_icon.pixmap(
+                self.original_icon.actualSize(QSize(1000, 1000))
+            )
+            pixmap = source.scaled(
+                icon_size, Qt.KeepAspectRatio, Qt.SmoothTransformation
+            )
+            SCALED_ICON_CACHE.put(key, pixmap)
+
+        self._scaled_icon = QIcon(pixmap)
+        self._scaled_icon_key = key
+
     def _adjust_content_size(self):
         """
         Internal method to calculate and apply optimal font size for the text
@@ -178,16 +351,9 @@ class ScalableButton(QPushButton):
         # --- Step 1: Adjust icon size based on available height and aspect ratio ---
         current_icon_size = QSize(0, 0)
         if not self.original_icon.isNull():
-            # Get the largest available pixmap from the original icon to calculate its true aspect ratio.
-            original_pixmap_for_ratio = self.original_icon.pixmap(
-                self.original_icon.actualSize(QSize(1000, 1000))
-            )
-            if not original_pixmap_for_ratio.isNull():
-                icon_aspect_ratio = (
-                    original_pixmap_for_ratio.width()
-                    / original_pixmap_for_ratio.height()
-                )
-
+            # The aspect ratio is worked out once per icon, in setIcon().
+            icon_aspect_ratio = self._icon_aspect_ratio
+            if icon_aspect_ratio is not None:
                 # Calculate desired icon dimensions to fit available height maintaining aspect ratio
                 desired_icon_height = int(
                     available_height * 0.8
@@ -221,9 +387,9 @@ class ScalableButton(QPushButton):
                     max(1, desired_icon_width), max(1, desired_icon_height)
                 )
 
+        if self.iconSize() != current_icon_size:
             self.setIconSize(current_icon_size)
-        else:
-            self.setIconSize(QSize(0, 0))
+        self._update_scaled_icon(current_icon_size)
 
         # --- Step 2: Determine available width for text after icon is sized ---
         # QPushButton by default places icon to the left of text.
@@ -241,6 +407,32 @@ class ScalableButton(QPushButton):
             text_available_width = max(0, available_width - icon_space_consumed)
 
         # --- Step 3: Determine optimal font size based on adjusted available space ---
+        current_font = self.font()
+        cache_key = (
+            self.text(),
+            current_font.family(),
+            text_available_width,
+            available_height,
+            current_icon_size.width(),
+        )
+        optimal_pixel_size = FONT_FIT_CACHE.get(cache_key)
+        if optimal_pixel_size is None:
+            optimal_pixel_size = self._fit_font_pixel_size(
+                text_available_width, available_height
+            )
+            FONT_FIT_CACHE.put(cache_key, optimal_pixel_size)
+
+        # Apply the determined optimal font pixel size, skipping the relayout
+        # setFont() causes when nothing changed
+        if current_font.pixelSize() != optimal_pixel_size:
+            current_font.setPixelSize(optimal_pixel_size)
+            self.setFont(current_font)
+
+    def _fit_font_pixel_size(self, text_available_width: int, available_height: int) -> int:
+        """
+        Binary searches the largest font pixel size at which the text fits in
+        the given area.
+        """
         optimal_pixel_size = 1
         # Max font height 90% of available button height
         # Ensure max_possible_pixel_size is at least 1 to avoid zero division/infinite loops
@@ -270,10 +462,7 @@ class ScalableButton(QPushButton):
             else:
                 high = mid - 1  # Text does not fit, need a smaller size
 
-        # Apply the determined optimal font pixel size
-        current_font = self.font()
-        current_font.setPixelSize(optimal_pixel_size)
-        self.setFont(current_font)
+        return optimal_pixel_size
 
 
 # --- Example Usage (demonstrates the ScalableButton in a grid) ---
@@ -1,4 +1,10 @@
-import gui.comm as comm
+import os
+import sys
+
+# The gui modules import each other as top-level modules.
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "gui"))
+
+import comm
 
 def main():
     ser = comm.Serial(port="/dev/ttyV1")
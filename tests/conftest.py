@@ -0,0 +1,23 @@
+import importlib.util
+import os
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+HOST_DIR = os.path.join(ROOT, "host")
+GUI_DIR = os.path.join(ROOT, "pi4", "gui")
+
+# Both sides import their modules as top-level ones. The host's come first;
+# the modules they share are identical (see test_shared_modules.py), and
+# only modules the host doesn't have, e.g. assets, are taken from the Pi.
+sys.path[:0] = [HOST_DIR, GUI_DIR]
+
+
+def load_pi_module(name: str):
+    """
+    Imports pi4/gui/<name>.py as "pi_<name>", for modules whose name the host
+    also uses, e.g. comm.
+    """
+    spec = importlib.util.spec_from_file_location(f"pi_{name}", os.path.join(GUI_DIR, f"{name}.py"))
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
@@ -0,0 +1,65 @@
+import hashlib
+import pytest
+from assets import AssetStore, AssetTransfer
+
+DATA = bytes(range(256)) * 10
+KEY = "sha256:" + hashlib.sha256(DATA).hexdigest()
+CHUNK = 1000
+
+
+def chunks() -> list[bytes]:
+    return [DATA[i : i + CHUNK] for i in range(0, len(DATA), CHUNK)]
+
+
+def test_out_of_order_chunks():
+    transfer = AssetTransfer(KEY, len(DATA), CHUNK)
+    for index in reversed(range(len(chunks()))):
+        assert transfer.first_missing() == 0
+        transfer.write_chunk(index, chunks()[index])
+    assert transfer.first_missing() == transfer.chunk_count
+    assert transfer.verify()
+
+
+def test_resume_keeps_received_chunks():
+    store = AssetStore()
+    store.begin(KEY, len(DATA), CHUNK).write_chunk(0, chunks()[0])
+    transfer = store.begin(KEY, len(DATA), CHUNK)
+    assert transfer.first_missing() == 1
+    for index, chunk in enumerate(chunks()[1:], 1):
+        transfer.write_chunk(index, chunk)
+    assert store.finish(KEY) == DATA
+    assert KEY not in store.transfers
+
+
+def test_incomplete_or_corrupt_transfers_are_refused():
+    store = AssetStore()
+    store.begin(KEY, len(DATA), CHUNK).write_chunk(0, chunks()[0])
+    assert store.finish(KEY) is None
+
+    transfer = store.begin(KEY, len(DATA), CHUNK)
+    for index, chunk in enumerate(chunks()):
+        transfer.write_chunk(index, bytes(len(chunk)) if index == 1 else chunk)
+    assert store.finish(KEY) is None
+
+
+@pytest.mark.parametrize("index, data", [(-1, b"x"), (3, b"x"), (0, b"short")])
+def test_bad_chunks(index, data):
+    with pytest.raises(ValueError):
+        AssetTransfer(KEY, len(DATA), CHUNK).write_chunk(index, data)
+
+
+def test_rejected_uploads_are_answered_invalid(monkeypatch):
+    pytest.importorskip("PySide6")
+    import sys
+    from types import SimpleNamespace
+    from conftest import load_pi_module
+
+    # The handlers import the Pi's comm, not the host's.
+    monkeypatch.setitem(sys.modules, "comm", load_pi_module("comm"))
+    from comm_updater.comm_updater import update_comm
+
+    window = SimpleNamespace(assets=AssetStore())
+    window.assets.begin(KEY, len(DATA), CHUNK)
+    bad_chunk = {"type": "asset_chunk", "hash": KEY, "index": 0, "data": b"short"}
+    bad_icon = {"type": "icon_put", "hash": KEY, "icon": b"not the asset"}
+    assert update_comm(window, [bad_chunk, bad_icon]) == ["invalid", "invalid"]
@@ -0,0 +1,78 @@
+import shlex
+import pytest
+from conftest import load_pi_module
+
+pi_comm = load_pi_module("comm")
+
+KEY = "sha256:" + "ab" * 32
+
+
+def parse(line: str) -> dict:
+    args = shlex.split(line)
+    return pi_comm.find_parser(args)(args)
+
+
+@pytest.mark.parametrize(
+    "line",
+    [
+        f"ui icon 0 0 {KEY}",
+        f"ui icon all {KEY}",
+        f"icon put {KEY} AAAA",
+        f"asset begin {KEY} 10 4",
+        f"asset chunk {KEY} 0 AAAA",
+        f"asset end {KEY}",
+    ],
+)
+def test_content_keys_are_accepted(line):
+    assert KEY in parse(line).values()
+
+
+@pytest.mark.parametrize(
+    "key",
+    [
+        "sha256:/dev/zero",
+        "sha256:../../etc/passwd",
+        "sha256:" + "AB" * 32,
+        "sha256:" + "ab" * 31,
+        KEY + "/x",
+    ],
+)
+@pytest.mark.parametrize(
+    "line",
+    [
+        "ui icon 0 0 {}",
+        "ui icon rect 0 0 2 2 {}",
+        "icon put {} AAAA",
+        "asset begin {} 10 4",
+        "asset chunk {} 0 AAAA",
+        "asset end {}",
+    ],
+)
+def test_bad_content_keys_are_refused(line, key):
+    with pytest.raises(ValueError):
+        parse(line.format(key))
+
+
+def test_text_off_the_grid_is_invalid_unless_a_region(monkeypatch):
+    pytest.importorskip("PySide6")
+    monkeypatch.setenv("QT_QPA_PLATFORM", "offscreen")
+    import sys
+    from types import SimpleNamespace
+    from PySide6.QtWidgets import QApplication
+    from widgets.main_grid import MainGridWidget
+
+    # The handlers import the Pi's comm, not the host's.
+    monkeypatch.setitem(sys.modules, "comm", pi_comm)
+    from comm_updater.comm_updater import update_comm
+
+    app = QApplication.instance() or QApplication([])
+    grid = MainGridWidget(1, 1)
+    grid.resizeGrid(3, 2)
+    grid.state.clean(3, 2)
+    window = SimpleNamespace(main_grid=grid)
+
+    updates = [parse(line) for line in ("ui text 9 9 hi", "ui text 2 1 hi", "ui text cells 9,9 2,0 hi")]
+    assert update_comm(window, updates) == ["invalid", None, None]
+    assert grid.button(2, 1).text() == "hi"
+    assert grid.button(2, 0).text() == "hi"
+    assert (9, 9) not in grid.state.cells
@@ -0,0 +1,54 @@
+import asyncio
+import time
+from types import SimpleNamespace
+import discovery
+
+
+def test_only_usb_and_matching_ports_are_candidates(monkeypatch):
+    ports = [
+        SimpleNamespace(device="/dev/ttyS0", vid=None),
+        SimpleNamespace(device="/dev/ttyAMA0", vid=None),
+        SimpleNamespace(device="/dev/rfcomm0", vid=None),
+        SimpleNamespace(device="COM3", vid=0x2E8A),
+    ]
+    monkeypatch.setattr(discovery.list_ports, "comports", lambda: ports)
+    monkeypatch.setattr(discovery.glob, "glob", lambda pattern: [])
+    assert discovery.candidate_ports() == ["/dev/ttyAMA0", "COM3"]
+    assert discovery.candidate_ports(("/dev/rfcomm*",)) == ["/dev/rfcomm0", "COM3"]
+
+
+def probe_after(delays: dict[str, float], opened: list[str]):
+    async def probe(port, timeout, baudrate):
+        opened.append(port)
+        if port not in delays:
+            await asyncio.sleep(timeout)
+            return False
+        await asyncio.sleep(delays[port])
+        return True
+
+    return probe
+
+
+def test_the_cached_port_is_tried_first(monkeypatch, tmp_path):
+    cache = tmp_path / "port"
+    cache.write_text("/dev/ttyACM1\n")
+    monkeypatch.setattr(discovery, "candidate_ports", lambda patterns: ["/dev/ttyUSB0", "/dev/ttyACM1"])
+
+    opened = []
+    monkeypatch.setattr(discovery, "probe", probe_after({"/dev/ttyACM1": 0.01}, opened))
+    assert asyncio.run(discovery.find_port(cache_path=str(cache))) == "/dev/ttyACM1"
+    assert opened == ["/dev/ttyACM1"]
+
+
+def test_a_stale_cached_port_does_not_hold_up_the_scan(monkeypatch, tmp_path):
+    cache = tmp_path / "port"
+    cache.write_text("/dev/ttyACM1\n")
+    monkeypatch.setattr(discovery, "candidate_ports", lambda patterns: ["/dev/ttyUSB0", "/dev/ttyACM1"])
+
+    opened = []
+    monkeypatch.setattr(discovery, "probe", probe_after({"/dev/ttyUSB0": 0.01}, opened))
+    start = time.monotonic()
+    assert asyncio.run(discovery.find_port(timeout=1, cache_path=str(cache))) == "/dev/ttyUSB0"
+    assert time.monotonic() - start < 0.5
+    assert opened == ["/dev/ttyACM1", "/dev/ttyUSB0"]
+    assert cache.read_text() == "/dev/ttyUSB0\n"
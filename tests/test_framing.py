@@ -0,0 +1,39 @@
+import framing
+from framing import FRAME_TEXT, Frame, FrameDecoder, encode_frame
+
+
+def test_round_trip_split_across_reads():
+    data = encode_frame(FRAME_TEXT, b"ui clean 8 5", 7) + encode_frame(FRAME_TEXT, b"stats", 8)
+    decoder = FrameDecoder()
+    frames = []
+    for i in range(len(data)):
+        frames += decoder.feed(data[i : i + 1])
+    assert frames == [Frame(FRAME_TEXT, 7, b"ui clean 8 5"), Frame(FRAME_TEXT, 8, b"stats")]
+    assert decoder.errors == 0
+
+
+def test_resyncs_after_a_corrupted_frame():
+    bad = bytearray(encode_frame(FRAME_TEXT, b"ui bgcolor 0 0 #FF0000", 1))
+    bad[framing.HEADER.size + 3] ^= 0xFF
+    good = encode_frame(FRAME_TEXT, b"ui bgcolor 1 0 #00FF00", 2)
+    decoder = FrameDecoder()
+    frames = decoder.feed(b"noise\n" + bytes(bad) + good)
+    assert frames == [Frame(FRAME_TEXT, 2, b"ui bgcolor 1 0 #00FF00")]
+    assert decoder.errors == 1
+
+
+def test_oversized_length_is_skipped():
+    header = framing.HEADER.pack(framing.MAGIC, FRAME_TEXT, 1, framing.MAX_PAYLOAD + 1)
+    good = encode_frame(FRAME_TEXT, b"ok", 2)
+    assert FrameDecoder().feed(header + good) == [Frame(FRAME_TEXT, 2, b"ok")]
+
+
+def test_compressed_payload():
+    payload = b"ui button 0 0 1 1 hello dispatch nop\n" * 20
+    data = encode_frame(FRAME_TEXT, payload, 3, compress=True)
+    assert len(data) < len(payload)
+    assert FrameDecoder().feed(data) == [Frame(FRAME_TEXT, 3, payload)]
+
+
+def test_small_payloads_are_not_compressed():
+    assert encode_frame(FRAME_TEXT, b"stats", 1, compress=True) == encode_frame(FRAME_TEXT, b"stats", 1)
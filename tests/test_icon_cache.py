@@ -0,0 +1,24 @@
+import hashlib
+import pytest
+
+pytest.importorskip("PySide6")
+import icon_cache
+from icon_cache import IconCache
+
+
+def test_keys_that_are_not_hashes_never_reach_the_disk(tmp_path):
+    cache = IconCache(disk_dir=str(tmp_path))
+    for key in ("sha256:/etc/passwd", "sha256:/dev/zero", "sha256:../icons"):
+        assert not cache.has(key)
+        assert cache.read_bytes(key) is None
+
+
+def test_reads_are_capped(tmp_path, monkeypatch):
+    data = b"x" * 100
+    key = "sha256:" + hashlib.sha256(data).hexdigest()
+    cache = IconCache(disk_dir=str(tmp_path))
+    cache._write_bytes(key, data)
+    assert cache.read_bytes(key) == data
+
+    monkeypatch.setattr(icon_cache, "MAX_ASSET_SIZE", 50)
+    assert cache.read_bytes(key) is None
@@ -0,0 +1,117 @@
+import shlex
+import pytest
+from layout import Layout, parse_region, region_tokens
+
+
+def grid(width: int, height: int) -> Layout:
+    layout = Layout()
+    layout.clean(width, height)
+    for x in range(width):
+        for y in range(height):
+            layout.set_button(x, y, f"{x},{y}", 1, 1, "dispatch", "nop")
+    return layout
+
+
+def replay(layout: Layout, commands: list[str]) -> Layout:
+    for command in commands:
+        layout.apply(shlex.split(command))
+    return layout
+
+
+def test_diff_round_trips_through_apply():
+    old = grid(4, 3)
+    new = grid(4, 3)
+    new.set_color(0, 0, "bgcolor", "#FF0000")
+    new.set_icon(3, 2, "sha256:ab")
+    new.set_button(1, 1, "other", 2, 1, "broadcast", "hello")
+    old.set_color(2, 0, "textcolor", "#0000FF")  # Only unset by a reset.
+
+    commands = old.diff(new)
+    assert "ui reset 2 0" in commands
+    assert replay(old, commands).cells == new.cells
+
+
+def test_diff_groups_cells_into_regions():
+    old = grid(10, 5)
+    new = grid(10, 5)
+    for x in range(10):
+        for y in range(5):
+            new.set_color(x, y, "bgcolor", "#FF0000")
+    new.set_color(2, 1, "textcolor", "#00FF00")
+    new.set_color(3, 1, "textcolor", "#00FF00")
+    new.set_icon(0, 4, "sha256:ab")
+    new.set_icon(9, 0, "sha256:ab")
+    new.set_text(4, 4, "new text")
+
+    commands = old.diff(new)
+    assert "ui bgcolor all '#FF0000'" in commands
+    assert "ui textcolor rect 2 1 2 1 '#00FF00'" in commands
+    assert "ui icon cells 0,4 9,0 sha256:ab" in commands
+    assert replay(old, commands).cells == new.cells
+
+
+def test_commands_rebuild_the_layout():
+    layout = grid(4, 2)
+    layout.set_color(0, 0, "bgcolor", "#123456")
+    layout.set_color(1, 1, "bgcolor", "#654321")
+    assert replay(Layout(), layout.commands()).cells == layout.cells
+
+
+def test_diff_of_equal_layouts_is_empty():
+    assert grid(3, 3).diff(grid(3, 3)) == []
+
+
+def test_resize_redraws_everything():
+    assert grid(2, 2).diff(grid(3, 2))[0] == "ui clean 3 2"
+
+
+def test_region_selection():
+    layout = grid(3, 2)
+    assert layout.region(parse_region(["all"])) == [(0, 0), (1, 0), (2, 0), (0, 1), (1, 1), (2, 1)]
+    assert layout.region(parse_region(["rect", "1", "0", "2", "2"])) == [(1, 0), (2, 0), (1, 1), (2, 1)]
+    # Off-grid cells are skipped.
+    assert layout.region(parse_region(["rect", "2", "1", "5", "5"])) == [(2, 1)]
+    assert layout.region(parse_region(["cells", "0,1", "-1,0", "7,0", "2,0"])) == [(0, 1), (2, 0)]
+
+
+def test_region_commands_apply_to_every_cell():
+    layout = replay(grid(3, 2), ["ui bgcolor rect 0 0 2 2 #FF0000", "ui text cells 2,1 hello"])
+    assert [cell for cell, fields in layout.cells.items() if "bgcolor" in fields] == [
+        (0, 0),
+        (0, 1),
+        (1, 0),
+        (1, 1),
+    ]
+    assert layout.cells[(2, 1)]["button"] == ["hello", 1, 1, "dispatch", "nop"]
+
+
+@pytest.mark.parametrize(
+    "tokens",
+    [
+        [],
+        ["all", "extra"],
+        ["rect", "0", "0", "0", "1"],
+        ["rect", "0", "0", "100", "100"],
+        ["rect", "0", "0", "1"],
+        ["cells"],
+        ["cells", "1"],
+        ["cells", "1,2,3"],
+        ["row", "1"],
+    ],
+)
+def test_invalid_regions(tokens):
+    with pytest.raises(ValueError):
+        parse_region(tokens)
+
+
+@pytest.mark.parametrize(
+    "cells, tokens",
+    [
+        ([(0, 0), (1, 0), (0, 1), (1, 1)], ["all"]),
+        ([(1, 0), (1, 1)], ["rect", "1", "0", "1", "2"]),
+        ([(0, 0), (1, 1)], ["cells", "0,0", "1,1"]),
+    ],
+)
+def test_region_tokens(cells, tokens):
+    assert region_tokens(cells, (2, 2)) == tokens
+    assert sorted(grid(2, 2).region(parse_region(tokens))) == sorted(cells)
@@ -0,0 +1,152 @@
+import random
+import time
+import pytest
+import serial
+from conftest import load_pi_module
+
+import comm as host_comm
+
+pi_comm = load_pi_module("comm")
+
+
+class FakeSerial:
+    """One end of a serial link that loses whole writes with probability `loss`."""
+
+    def __init__(self, rng: random.Random):
+        self.rng = rng
+        self.loss = 0.0
+        self.peer: "FakeSerial | None" = None
+        self.baudrate = 115200
+        self.is_open = True
+        self._rx = bytearray()
+
+    @property
+    def in_waiting(self) -> int:
+        return len(self._rx)
+
+    def read(self, size: int = 1) -> bytes:
+        data = bytes(self._rx[:size])
+        del self._rx[:size]
+        return data
+
+    def write(self, data: bytes) -> int:
+        if self.rng.random() >= self.loss:
+            self.peer._rx += data
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def close(self):
+        self.is_open = False
+
+    def open(self):
+        self.is_open = True
+
+
+@pytest.fixture
+def link(monkeypatch):
+    """A host and a Pi Serial wired to each other, not handshaken yet."""
+    rng = random.Random(1234)
+    ends = [FakeSerial(rng), FakeSerial(rng)]
+    ends[0].peer, ends[1].peer = ends[1], ends[0]
+    pending = list(ends)
+    monkeypatch.setattr(serial, "Serial", lambda *args, **kwargs: pending.pop(0))
+    host = host_comm.Serial(ack_timeout=0.005, max_retries=1000)
+    pi = pi_comm.Serial()
+    return host, pi
+
+
+def handshake(host, pi, binary: bool):
+    pi.tick()  # Announces itself.
+    init = [line for line in host.poll() if line.startswith("handshake stage1 init")][-1]
+    assert host.complete_handshake(init, binary)
+    pi.tick()
+    assert pi.handshake_complete_stage[1]
+    assert pi.binary == binary
+
+
+def run(host, pi, applied: list, timeout: float = 10.0):
+    """Ticks both ends until the host has nothing left to send."""
+    deadline = time.monotonic() + timeout
+    while host.pending():
+        assert time.monotonic() < deadline, "link stalled"
+        updates = [update for update in pi.tick() if update["type"] != "loading_status"]
+        applied += [update for update in updates]
+        pi.answer(updates, [None] * len(updates))
+        host.poll()
+        time.sleep(0.001)
+
+
+@pytest.mark.parametrize("binary", [False, True])
+def test_lossy_link_delivers_in_order_exactly_once(link, binary):
+    host, pi = link
+    handshake(host, pi, binary)
+    acks = {}
+    host.on_ack = lambda seq, error: acks.setdefault(seq, error)
+    host.ser.loss = pi.ser.loss = 0.2
+
+    colors = [f"#{i:06X}" for i in range(200)]
+    seqs = [host.send(f"ui bgcolor 0 0 {color}") for color in colors]
+    applied = []
+    run(host, pi, applied)
+
+    assert [update["color"] for update in applied] == colors
+    assert acks == {seq: None for seq in seqs}
+
+
+def test_out_of_order_commands_wait_for_the_gap(link):
+    host, pi = link
+    handshake(host, pi, binary=False)
+    host.ser.loss = 0.0
+
+    first = host._first_unacked_seq()
+    host.ser.write(f"@{first + 1} ui clean 2 2\n".encode())
+    assert [u for u in pi.tick() if u["type"] != "loading_status"] == []
+
+    host.ser.write(f"@{first} ui clean 3 3\n@{first + 1} ui clean 2 2\n".encode())
+    updates = pi.tick()
+    assert [(u["width"], u["seq"]) for u in updates] == [(3, first), (2, first + 1)]
+    pi.answer(updates, [None, "invalid"])
+
+    # A retransmission is answered again but not applied again.
+    host.ser.write(f"@{first + 1} ui clean 2 2\n".encode())
+    assert pi.tick() == []
+    assert pi.ser.peer.read(1000).decode().splitlines()[-1] == f"error {first + 1} invalid"
+
+
+def test_timeout_goes_back_to_the_gap(link):
+    host, pi = link
+    handshake(host, pi, binary=True)
+    host.ack_timeout = 0.2
+
+    host.ser.loss = 1.0
+    lost = host.send("ui clean 3 3")
+    host.ser.loss = 0.0
+    time.sleep(0.12)
+    after = [host.send("ui clean 2 2"), host.send("stats")]
+    assert pi.tick() == []  # Both come after the gap.
+
+    # Only the lost command has timed out, but everything after it goes
+    # again with it.
+    time.sleep(0.1)
+    host.poll()
+    assert [update["seq"] for update in pi.tick()] == [lost, *after]
+
+
+def test_partial_lines_are_buffered(link):
+    _, pi = link
+    pi.handshake_complete_stage[1] = True
+    pi.ser._rx += b"ui clean 2 2\nui bgco"
+    assert [u["type"] for u in pi.tick()] == ["ui_clean"]
+    pi.ser._rx += b"lor 1 1 #FF0000\n"
+    assert [(u["type"], u["x"], u["color"]) for u in pi.tick()] == [("ui_bgcolor", 1, "#FF0000")]
+
+
+def test_overlong_line_is_dropped(link):
+    _, pi = link
+    pi.handshake_complete_stage[1] = True
+    pi.ser._rx += b"x" * (pi_comm.MAX_BUFFER_SIZE + 1)
+    assert pi.tick() == []
+    pi.ser._rx += b"rest of the garbage\nui clean 2 2\n"
+    assert [u["type"] for u in pi.tick()] == ["ui_clean"]
@@ -0,0 +1,16 @@
+import os
+import pytest
+from conftest import GUI_DIR, HOST_DIR
+
+# Modules both the host and the Pi import, kept as two copies so each side
+# runs from its own directory.
+SHARED_MODULES = ["framing.py", "heartbeat.py", "layout.py", "stats.py"]
+
+
+@pytest.mark.parametrize("name", SHARED_MODULES)
+def test_copies_are_identical(name):
+    with open(os.path.join(HOST_DIR, name), "rb") as file:
+        host = file.read()
+    with open(os.path.join(GUI_DIR, name), "rb") as file:
+        pi = file.read()
+    assert host == pi, f"host/{name} and pi4/gui/{name} differ"